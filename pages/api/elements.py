@@ -22,7 +22,7 @@
 # OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import base64
-import logging
+import itertools, json, logging
 import re
 from io import BytesIO
 
@@ -33,7 +33,7 @@ from django.core.files.uploadedfile import (SimpleUploadedFile,
     TemporaryUploadedFile)
 from django.db import transaction
 from django.db.models import Max, Q
-from django.http import Http404, QueryDict
+from django.http import Http404, QueryDict, StreamingHttpResponse
 from markdownify import markdownify as md
 from rest_framework import (generics, response as api_response,
     status)
@@ -41,6 +41,7 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.mixins import CreateModelMixin
 from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
 from extended_templates.api.assets import process_upload
 from extended_templates.api.serializers import AssetSerializer
 from extended_templates.utils import _get_media_prefix
@@ -48,14 +49,18 @@ from extended_templates.utils import _get_media_prefix
 from .. import settings
 from ..docs import extend_schema
 from ..compat import (NoReverseMatch, is_authenticated, reverse,
-    gettext_lazy as _)
+    gettext_lazy as _, six)
 from ..helpers import ContentCut, get_extra
 from ..mixins import AccountMixin, PageElementMixin, TrailMixin
-from ..models import (PageElement, RelationShip, build_content_tree,
-    flatten_content_tree, Follow)
+from ..models import (PageElement, RelationShip, RelationShipClosure,
+    build_content_tree, iter_content_tree, Follow)
+from ..search import get_search_engine
+from ..transfer import export_content_tree, import_content_tree
 from ..utils import validate_title
 from .serializers import (NodeElementCreateSerializer,
-    PageElementDetailSerializer, PageElementTagSerializer)
+    NodeElementSerializer, PageElementDetailSerializer,
+    PageElementImportSerializer, PageElementSerializer,
+    PageElementTagSerializer)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -84,9 +89,10 @@ class PageElementListMixin(TrailMixin):
                 cut=self.get_cut(),
                 visibility=self.visibility,
                 accounts=self.owners)
-            items = flatten_content_tree(
+            items = iter_content_tree(
                 content_tree, sort_by_key=False, depth=-1)
-            items.pop(0)
+            # skips `self.element`, the root of the tree.
+            next(items, None)
         else:
             cut = self.get_cut()
             if not cut:
@@ -98,18 +104,15 @@ class PageElementListMixin(TrailMixin):
                 accounts=self.owners)
             # We do not re-sort the roots such that member-only content
             # appears at the top.
-            items = flatten_content_tree(content_tree, sort_by_key=False)
+            items = iter_content_tree(content_tree, sort_by_key=False)
 
-        results = []
-        for item in items:
-            searchable = get_extra(item, 'searchable', False)
-            if searchable:
-                results += [item]
-
-        return results
+        return (item for item in items
+            if get_extra(item, 'searchable', False))
 
     def get_queryset(self):
         results = self.get_results()
+        if not hasattr(results, '__len__'):
+            results = list(results)
         self.attach(results)
         return results
 
@@ -121,6 +124,11 @@ class PageElementAPIView(PageElementListMixin, generics.ListAPIView):
     Returns a flat list of page elements starting with a prefix. The `indent`
     field is used to indicate the level of the element in the tree.
 
+    The whole tree is returned unless a page is requested (ex: `?page=2`),
+    in which case `next` and `previous` link to the surrounding pages
+    of the flat list. With `?stream=1`, the list is sent as a streamed
+    response, serialized as the tree is traversed.
+
     **Tags: content
 
     **Example
@@ -172,18 +180,91 @@ class PageElementAPIView(PageElementListMixin, generics.ListAPIView):
 
     filter_backends = (SearchFilter, OrderingFilter,)
 
+    stream_param = 'stream'
+    stream_batch_size = 100
+
+    def get_serializer_context(self):
+        context = super(PageElementAPIView, self).get_serializer_context()
+        if self.full_path:
+            # The path to the element was already resolved from the URL.
+            context.update({'prefix': self.full_path[
+                :self.full_path.rfind(self.URL_PATH_SEP) + 1]})
+        return context
+
+    def is_paginated(self):
+        """
+        Returns `True` when the request asks for a page of the flattened
+        content tree rather than the whole tree.
+        """
+        if self.paginator is None:
+            return False
+        for param in (getattr(self.paginator, 'page_query_param', None),
+                      getattr(self.paginator, 'page_size_query_param', None),
+                      getattr(self.paginator, 'limit_query_param', None),
+                      getattr(self.paginator, 'offset_query_param', None)):
+            if param and self.get_query_param(param):
+                return True
+        return False
+
+    def is_streamed(self):
+        stream = self.get_query_param(self.stream_param)
+        return bool(stream) and stream.lower() in ('1', 'true')
+
     def list(self, request, *args, **kwargs):
         #pylint:disable=unused-argument
-        results = self.get_queryset()
+        results = self.get_results()
 
         # We have multiple roots so we create an unifying top-level root.
         element = self.element if self.element else PageElement()
         element.path = self.full_path
+        if self.is_streamed():
+            return StreamingHttpResponse(
+                self.stream_results(element, results),
+                content_type='application/json')
+        if not hasattr(results, '__len__'):
+            results = list(results)
+        if self.is_paginated():
+            page = self.paginate_queryset(results)
+            self.attach(page)
+            element.results = page
+            data = self.get_serializer(element).data
+            response = self.get_paginated_response(data.pop('results', []))
+            data.update(response.data)
+            response.data = data
+            return response
+        self.attach(results)
         element.results = results
         element.count = len(results)
         serializer = self.get_serializer(element)
         return api_response.Response(serializer.data)
 
+    def stream_results(self, element, results):
+        """
+        Generates the JSON response for *element* while *results* are
+        serialized, `stream_batch_size` at a time, such that the whole
+        response is never held in memory.
+        """
+        element.results = []
+        data = self.get_serializer(element).data
+        data.pop('results', None)
+        data.pop('count', None)
+        head = json.dumps(data, cls=JSONEncoder)
+        yield head[:-1] + (", " if data else "") + '"results": ['
+        context = self.get_serializer_context()
+        count = 0
+        results = iter(results)
+        while True:
+            batch = list(itertools.islice(results, self.stream_batch_size))
+            if not batch:
+                break
+            self.attach(batch)
+            items = NodeElementSerializer(
+                batch, many=True, context=context).data
+            yield (", " if count else "") + ", ".join([
+                json.dumps(item, cls=JSONEncoder) for item in items])
+            count += len(batch)
+        yield '], "count": %d}' % count
+
 
 class PageElementIndexAPIView(PageElementAPIView):
     """
@@ -238,7 +319,8 @@ class PageElementSearchAPIView(PageElementAPIView):
     """
     Searches page elements
 
-    Returns a list of page elements whose title matches a search criteria.
+    Returns a list of page elements whose title, text or tags match
+    a search criteria ``q``, most relevant first.
 
     **Tags: content
 
@@ -246,7 +328,7 @@ class PageElementSearchAPIView(PageElementAPIView):
 
     .. code-block:: http
 
-        GET /api/content/search HTTP/1.1
+        GET /api/content/search?q=hello HTTP/1.1
 
     responds
 
@@ -264,11 +346,76 @@ class PageElementSearchAPIView(PageElementAPIView):
         }
     """
 
+    search_param = 'q'
+
     @extend_schema(operation_id='content_search')
     def get(self, request, *args, **kwargs):
         return super(PageElementSearchAPIView, self).get(
             request, *args, **kwargs)
 
+    def list(self, request, *args, **kwargs):
+        search_string = self.get_query_param(self.search_param)
+        if not search_string:
+            return super(PageElementSearchAPIView, self).list(
+                request, *args, **kwargs)
+
+        # Matching page elements are returned ranked and paginated
+        # by the search engine.
+        queryset = PageElement.objects.filter_available(
+            visibility=self.visibility, accounts=self.owners)
+        if self.element:
+            # Only page elements in the content tree under the URL prefix
+            # are matched.
+            queryset = queryset.filter(Q(pk=self.element.pk) |
+                Q(pk__in=RelationShipClosure.objects.filter(
+                    ancestor=self.element).values('descendant_id')))
+        queryset = get_search_engine().search(
+            queryset, search_string, searchable_only=True)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            page = list(queryset)
+        paths_by_pk = None
+        parent_index = None
+        if self.element:
+            # The path of an element is the one in the tree under
+            # the URL prefix.
+            pks_paths = RelationShipClosure.objects.get_descendant_paths(
+                self.element.pk, [element.pk for element in page])
+            slugs = dict(PageElement.objects.filter(pk__in=set(
+                itertools.chain.from_iterable(pks_paths.values()))).values_list(
+                'pk', 'slug'))
+            paths_by_pk = {self.element.pk: self.full_path}
+            for pk, pks_path in six.iteritems(pks_paths):
+                paths_by_pk[pk] = self.full_path + "".join([
+                    self.URL_PATH_SEP + slugs[node_pk]
+                    for node_pk in pks_path[1:]])
+        else:
+            # The parents of all elements in the page are loaded at once.
+            parent_index = RelationShip.objects.get_parent_index(
+                pks=[element.pk for element in page])
+        items = []
+        for element in page:
+            if paths_by_pk is not None:
+                path = paths_by_pk[element.pk]
+            else:
+                parents = element.get_parent_paths(
+                    limit=1, parent_index=parent_index)
+                path = self.URL_PATH_SEP + self.URL_PATH_SEP.join(
+                    [parent.slug for parent in parents[0]]) if parents \
+                    else self.URL_PATH_SEP + element.slug
+            items += [{
+                'slug': element.slug,
+                'path': path,
+                'indent': 0,
+                'title': element.title,
+                'picture': element.picture,
+                'extra': element.extra
+            }]
+        serializer = NodeElementSerializer(items, many=True)
+        if self.paginator is None:
+            return api_response.Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
     def get_results(self):
         results = []
         for item in super(PageElementSearchAPIView, self).get_results():
@@ -310,6 +457,15 @@ class PageElementDetailAPIView(TrailMixin, generics.RetrieveAPIView):
     def get_object(self):
         return self.element
 
+    def get_serializer_context(self):
+        context = super(
+            PageElementDetailAPIView, self).get_serializer_context()
+        if self.full_path:
+            # The path to the element was already resolved from the URL.
+            context.update({'prefix': self.full_path[
+                :self.full_path.rfind(self.URL_PATH_SEP) + 1]})
+        return context
+
     def get(self, request, *args, **kwargs):
         if is_authenticated(self.request):
             # Marking the last time the PageElement was read by a user
@@ -408,9 +564,8 @@ class PageElementEditableListAPIView(AccountMixin, CreateModelMixin,
             search_string = self.request.query_params.get('q', None)
             if search_string is not None:
                 validate_title(search_string)
-                queryset = queryset.filter(
-                    Q(extra__icontains=search_string)
-                    | Q(title__icontains=search_string))
+                queryset = get_search_engine().search(
+                    queryset, search_string)
         except ValidationError:
             pass
         return queryset
@@ -644,17 +799,8 @@ class PageElementAddTags(AccountMixin, PageElementMixin,
         return self.element
 
     def perform_update(self, serializer):
-        curr_tags = serializer.instance.extra
-        if curr_tags:
-            curr_tags = curr_tags.split(',')
-        else:
-            curr_tags = []
-        add_tags = serializer.validated_data['tag'].split(',')
-        for tag in add_tags:
-            if not tag in curr_tags:
-                curr_tags.append(tag)
-        serializer.instance.extra = ','.join(curr_tags)
-        serializer.instance.save()
+        serializer.instance.add_tags(
+            serializer.validated_data['tag'])
 
 
 class PageElementRemoveTags(AccountMixin, PageElementMixin,
@@ -691,17 +837,8 @@ class PageElementRemoveTags(AccountMixin, PageElementMixin,
         return self.element
 
     def perform_update(self, serializer):
-        curr_tags = serializer.instance.extra
-        if curr_tags:
-            curr_tags = curr_tags.split(',')
-        else:
-            curr_tags = []
-        remove_tags = serializer.validated_data['tag'].split(',')
-        for tag in remove_tags:
-            if tag in curr_tags:
-                curr_tags.remove(tag)
-        serializer.instance.extra = ','.join(curr_tags)
-        serializer.instance.save()
+        serializer.instance.remove_tags(
+            serializer.validated_data['tag'])
 
 
 class ImportDocxView(AccountMixin, PageElementMixin, generics.GenericAPIView):
@@ -860,3 +997,82 @@ class ImportDocxView(AccountMixin, PageElementMixin, generics.GenericAPIView):
                 "Could not extract document ID from URL: \"%s\"" % str(url))
         return ("https://docs.google.com/document/d/%s/export?format=docx" %
             str(match.group(1)))
+
+
+class PageElementTransferAPIView(AccountMixin, TrailMixin,
+                                 generics.GenericAPIView):
+    """
+    Exports a content tree as JSON Lines
+
+    Streams the content tree rooted at the page element, or rooted at all
+    the page elements owned by the account without a parent, one line
+    per node. A node reachable through more than one path is fully
+    described on its first line only.
+
+    **Tags**: editors
+
+    **Examples
+
+    .. code-block:: http
+
+        GET /api/editables/alliance/content/transfer/metal HTTP/1.1
+
+    responds
+
+    .. code-block:: json
+
+        {"path": "/metal", "slug": "metal", "title": "Metal", ...}
+        {"path": "/metal/boxes", "slug": "boxes", "title": "Boxes", ...}
+    """
+    schema = None # JSON Lines responses are not described by OpenAPI.
+    serializer_class = PageElementImportSerializer
+    batch_size = 100
+
+    def get(self, request, *args, **kwargs):
+        if self.element:
+            roots = [self.element]
+        else:
+            roots = PageElement.objects.get_roots().filter(
+                account=self.account).order_by('title', 'pk')
+        return StreamingHttpResponse(
+            export_content_tree(roots, batch_size=self.batch_size),
+            content_type='application/x-ndjson')
+
+    def post(self, request, *args, **kwargs):
+        """
+        Imports content trees from JSON Lines
+
+        Creates the content trees described in the uploaded `file`,
+        in the format produced by a `GET` request, and attaches their roots
+        under the page element. The created page elements are owned
+        by the account.
+
+        **Tags**: editors
+
+        **Examples
+
+        .. code-block:: http
+
+            POST /api/editables/alliance/content/transfer/metal HTTP/1.1
+
+        responds
+
+        .. code-block:: json
+
+            {
+                "count": 1,
+                "results": [{
+                    "slug": "boxes",
+                    "title": "Boxes"
+                }]
+            }
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        roots = import_content_tree(serializer.validated_data['file'],
+            parent=self.element, account=self.account)
+        return api_response.Response({
+            'count': len(roots),
+            'results': PageElementSerializer(roots, many=True,
+                context=self.get_serializer_context()).data
+            }, status=status.HTTP_201_CREATED)
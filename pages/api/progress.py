@@ -24,17 +24,19 @@
 
 from datetime import timedelta
 
-from deployutils.helpers import datetime_or_now
 from rest_framework import response as api_response, status
-from rest_framework.exceptions import ValidationError
-from rest_framework.generics import DestroyAPIView, ListAPIView, RetrieveAPIView
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.generics import (DestroyAPIView, GenericAPIView,
+    ListAPIView, RetrieveAPIView)
 
 from .. import settings
-from ..compat import gettext_lazy as _
+from ..compat import gettext_lazy as _, is_authenticated
 from ..docs import extend_schema
-from ..mixins import EnumeratedProgressMixin, SequenceProgressMixin
+from ..mixins import (AccountMixin, EnumeratedProgressMixin,
+    SequenceProgressMixin)
 from ..models import EnumeratedElements, EnumeratedProgress, LiveEvent
-from .serializers import EnumeratedProgressSerializer
+from .serializers import (EnumeratedProgressPingSerializer,
+    EnumeratedProgressSerializer)
 
 
 class EnumeratedProgressListAPIView(SequenceProgressMixin, ListAPIView):
@@ -189,26 +191,85 @@ class EnumeratedProgressRetrieveAPIView(EnumeratedProgressMixin,
                 "viewing_duration": "00:00:56.000000"
             }
         """
-        instance = self.get_object()
-        now = datetime_or_now()
-
-        if instance.last_ping_time:
-            time_elapsed = now - instance.last_ping_time
-            # Add only the actual time elapsed, with a cap for inactivity
-            time_increment = min(time_elapsed, timedelta(seconds=settings.PING_INTERVAL+1))
-        else:
-            # Set the initial increment to the expected ping interval (i.e., 10 seconds)
-            time_increment = timedelta(seconds=settings.PING_INTERVAL)
-
-        instance.viewing_duration += time_increment
-        instance.last_ping_time = now
-        instance.save()
+        instance = None
+        key = None
+        if settings.PING_FLUSH_INTERVAL:
+            # Pings are recorded in a write-behind buffer, we look up
+            # the progress previously pinged through the same URL there.
+            key = (self.kwargs.get(self.user_url_kwarg) or (
+                self.request.user.username if is_authenticated(self.request)
+                else None),
+                self.kwargs.get(self.sequence_url_kwarg),
+                self.kwargs.get(self.rank_url_kwarg, 1))
+            instance = EnumeratedProgress.objects.get_buffered(key)
+        if instance is None:
+            instance = self.get_object()
+        EnumeratedProgress.objects.record_ping(instance, key=key)
 
         status_code = status.HTTP_200_OK
         serializer = self.get_serializer(instance)
         return api_response.Response(serializer.data, status=status_code)
 
 
+class EnumeratedProgressBatchAPIView(AccountMixin, GenericAPIView):
+    """
+    Updates viewing durations in bulk
+
+    Adds ``elapsed`` to the viewing duration of many users on elements
+    of sequences provided by ``{profile}`` in a single call. This is
+    typically used by a proxy reporting the attendance of a whole room
+    to a live event. The ``elapsed`` time is added as submitted.
+
+    The pings are recorded in a single transaction. If any user, sequence
+    or rank cannot be found, or a sequence is not provided by ``{profile}``,
+    none of them are recorded.
+
+    **Tags**: content, progress, provider
+
+    **Examples**
+
+    .. code-block:: http
+
+        POST /api/attendance/alliance/ HTTP/1.1
+
+    .. code-block:: json
+
+        [{
+            "user": "steve",
+            "sequence": "ghg-accounting-training",
+            "rank": 1,
+            "elapsed": "00:00:10"
+        }]
+
+    responds
+
+    .. code-block:: json
+
+        [{
+            "user": "steve",
+            "sequence": "ghg-accounting-training",
+            "rank": 1,
+            "elapsed": "00:00:10",
+            "viewing_duration": "00:01:10"
+        }]
+    """
+    serializer_class = EnumeratedProgressPingSerializer
+
+    def post(self, request, *args, **kwargs):
+        if (self.account_url_kwarg is None or
+            self.account_url_kwarg not in self.kwargs):
+            # Without a provider in the URL, pings could be recorded
+            # against any sequence.
+            raise PermissionDenied(_("pings must be recorded on behalf"\
+                " of a provider."))
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        results = EnumeratedProgress.objects.record_pings(
+            serializer.validated_data, self.account)
+        serializer = self.get_serializer(results, many=True)
+        return api_response.Response(serializer.data)
+
+
 class LiveEventAttendanceAPIView(EnumeratedProgressRetrieveAPIView):
     """
     Retrieves attendance to live event
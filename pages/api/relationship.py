@@ -25,13 +25,15 @@
 import logging
 from copy import deepcopy
 
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import Max
 from rest_framework import generics
 from rest_framework.exceptions import ValidationError
 
 from ..mixins import TrailMixin
-from ..models import RelationShip
+from ..models import (ElementTag, PageElement, RelationShip,
+    RelationShipClosure, invalidate_content_tree)
+from ..search import get_search_engine
 from .serializers import EdgeCreateSerializer
 
 
@@ -43,11 +45,18 @@ class EdgesUpdateAPIView(TrailMixin, generics.CreateAPIView):
     serializer_class = EdgeCreateSerializer
 
     def rank_or_max(self, root, rank=None):
+        """
+        Returns the rank of a new edge from *root* inserted at position
+        *rank* in the list of outbound edges, or appended when *rank*
+        is `None`.
+        """
         if rank is None:
             rank = self.get_queryset().filter(
                 orig_element=root).aggregate(Max('rank')).get(
                 'rank__max', None)
-            rank = 0 if rank is None else rank + 1
+            rank = 0 if rank is None else rank + RelationShip.RANK_GAP
+        else:
+            rank = RelationShip.objects.insert_available_rank(root, pos=rank)
         return rank
 
     @staticmethod
@@ -113,7 +122,7 @@ class PageElementAliasAPIView(EdgesUpdateAPIView):
         with transaction.atomic():
             RelationShip.objects.create(
                 orig_element=root, dest_element=node,
-                rank=self.rank_or_max(rank))
+                rank=self.rank_or_max(root, rank))
         return node
 
 
@@ -152,24 +161,99 @@ class PageElementMirrorAPIView(EdgesUpdateAPIView):
         return leaf
 
     def mirror_recursive(self, root, prefix="", new_prefix=""):
-        edges = RelationShip.objects.filter(
-            orig_element=root).select_related('dest_element')
-        if not edges:
+        """
+        Copies the subtree rooted at *root* and returns the root
+        of the copy.
+
+        Leafs are shared between the subtree and its copy unless
+        `mirror_leaf` returns a different node. The subtree is loaded
+        one level at a time, then the copied nodes and edges are inserted
+        in bulk on databases where `bulk_create` sets primary keys.
+        """
+        #pylint:disable=too-many-locals
+        edges_by_orig = {}
+        frontier = [root.pk]
+        visited = set(frontier)
+        while frontier:
+            edges = RelationShip.objects.filter(
+                orig_element_id__in=frontier).select_related(
+                'dest_element').order_by('rank', 'pk')
+            frontier = []
+            for edge in edges:
+                edges_by_orig.setdefault(
+                    edge.orig_element_id, []).append(edge)
+                if edge.dest_element_id not in visited:
+                    visited |= set([edge.dest_element_id])
+                    frontier += [edge.dest_element_id]
+        if root.pk not in edges_by_orig:
             return self.mirror_leaf(root, prefix=prefix, new_prefix=new_prefix)
-        new_root = deepcopy(root)
-        new_root.pk = None
-        new_root.slug = None
-        new_root.save()
-        prefix = prefix + "/" + root.slug
-        new_prefix = new_prefix + "/" + new_root.slug
-        for edge in edges:
+
+        # A node with outbound edges is copied once for each path
+        # it can be reached through.
+        new_elements = []
+        mirrored = [] # (edge, copy of orig_element) in depth-first order
+        stack = [(root, None, None)]
+        while stack:
+            node, edge, parent = stack.pop()
+            if node.pk in edges_by_orig:
+                new_node = deepcopy(node)
+                new_node.pk = None
+                new_node._state.adding = True #pylint:disable=protected-access
+                new_node.nb_upvotes = 0
+                new_node.nb_followers = 0
+                new_node.is_root = parent is None
+                new_node.is_leaf = False
+                new_elements += [new_node]
+                for child_edge in reversed(edges_by_orig[node.pk]):
+                    stack += [(child_edge.dest_element, child_edge, new_node)]
+            else:
+                new_node = None
+            if edge:
+                mirrored += [(edge, parent, new_node)]
+        for new_node, slug in zip(new_elements,
+                PageElement.objects.get_unique_slugs(
+                [new_node.title for new_node in new_elements])):
+            new_node.slug = slug
+
+        paths = {id(new_elements[0]): (prefix + "/" + root.slug,
+            new_prefix + "/" + new_elements[0].slug)}
+        new_edges = []
+        for edge, parent, new_node in mirrored:
+            parent_prefix, parent_new_prefix = paths[id(parent)]
+            if new_node is None:
+                new_node = self.mirror_leaf(edge.dest_element,
+                    prefix=parent_prefix, new_prefix=parent_new_prefix)
+            else:
+                paths[id(new_node)] = (
+                    parent_prefix + "/" + edge.dest_element.slug,
+                    parent_new_prefix + "/" + new_node.slug)
             new_edge = deepcopy(edge)
             new_edge.pk = None
-            new_edge.orig_element = new_root
-            new_edge.dest_element = self.mirror_recursive(
-                edge.dest_element, prefix=prefix, new_prefix=new_prefix)
-            new_edge.save()
-        return new_root
+            new_edge.orig_element = parent
+            new_edge.dest_element = new_node
+            new_edges += [new_edge]
+
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # `bulk_create` does not set primary keys on this database
+            # (ex: MySQL), so the copies are saved one at a time and signals
+            # update the closure table, tags, search index and flags.
+            for new_node in new_elements:
+                new_node.save()
+            for new_edge in new_edges:
+                new_edge.save()
+            return new_elements[0]
+
+        # Signals are not sent on `bulk_create` so we update the closure
+        # table, tags, search index and root/leaf flags here.
+        PageElement.objects.bulk_create(new_elements)
+        RelationShip.objects.bulk_create(new_edges)
+        RelationShipClosure.objects.insert_subtree(new_edges)
+        PageElement.objects.filter(pk__in=[new_edge.dest_element_id
+            for new_edge in new_edges]).update(is_root=False)
+        ElementTag.objects.create_tags(new_elements)
+        get_search_engine().index(new_elements)
+        invalidate_content_tree()
+        return new_elements[0]
 
     def perform_change(self, sources, targets, rank=None):
         root = targets[-1]
@@ -183,9 +267,13 @@ class PageElementMirrorAPIView(EdgesUpdateAPIView):
             # special case when we are mirroring a leaf element that already
             # exist under the root node (ref: `new_node == node`
             # through `mirror_leaf`).
-            RelationShip.objects.get_or_create(
-                orig_element=root, dest_element=new_node,
-                defaults={'rank': self.rank_or_max(root, rank)})
+            # The rank is only computed when the edge is created
+            # since `rank_or_max` might shift the ranks of siblings.
+            if not RelationShip.objects.filter(
+                    orig_element=root, dest_element=new_node).exists():
+                RelationShip.objects.create(
+                    orig_element=root, dest_element=new_node,
+                    rank=self.rank_or_max(root, rank))
         return new_node
 
 
@@ -233,8 +321,8 @@ class PageElementMoveAPIView(EdgesUpdateAPIView):
             if rank is None:
                 rank = self.rank_or_max(root, rank)
             else:
-                RelationShip.objects.insert_available_rank(root, pos=rank,
-                    node=sources[-1] if root == old_root else None)
+                rank = RelationShip.objects.insert_available_rank(root,
+                    pos=rank, node=sources[-1] if root == old_root else None)
             if root != old_root:
                 edge.orig_element = root
             edge.rank = rank
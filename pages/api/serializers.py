@@ -23,16 +23,18 @@
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 from __future__ import unicode_literals
 
-import json
+import functools, json, threading
+from datetime import timedelta
 
 import bleach
+from django.db import models
 from rest_framework import serializers
 
 
 from .. import settings
 from ..compat import gettext_lazy as _, is_authenticated
-from ..models import (Comment, Follow, PageElement, Vote, Sequence,
-    EnumeratedElements)
+from ..helpers import loads_extra
+from ..models import Comment, PageElement, Sequence, EnumeratedElements
 
 #pylint: disable=abstract-method
 
@@ -46,16 +48,79 @@ class ExtraField(serializers.CharField):
                 pass
         return super(ExtraField, self).to_internal_value(data)
 
+    def get_attribute(self, instance):
+        if self.source == 'extra':
+            try:
+                # ``PageElement`` caches the decoded `extra` field.
+                return instance.extra_data
+            except AttributeError:
+                pass
+        return super(ExtraField, self).get_attribute(instance)
+
     def to_representation(self, value):
+        value = loads_extra(value)
         if isinstance(value, dict):
             return value
-        try:
-            return json.loads(value)
-        except (TypeError, ValueError):
-            pass
         return super(ExtraField, self).to_representation(value)
 
 
+# `bleach.Cleaner` are not thread-safe, so each thread builds its own.
+_HTML_CLEANERS = threading.local()
+
+
+def get_html_cleaner(tags, attributes, strip=False):
+    """
+    Returns a `bleach.Cleaner` for the *tags*, *attributes* and *strip*
+    configuration. The cleaner is built once per thread and configuration.
+    """
+    return _get_html_cleaner(_get_html_cleaner_key(tags, attributes, strip))
+
+
+def clean_html(text, tags, attributes, strip=False):
+    """
+    Returns *text* sanitized with `bleach`.
+
+    Results are memoized so the same HTML body submitted again
+    is not parsed another time.
+    """
+    if not isinstance(text, str):
+        return get_html_cleaner(tags, attributes, strip).clean(text)
+    return _clean_html(text, _get_html_cleaner_key(tags, attributes, strip))
+
+
+def _get_html_cleaner_key(tags, attributes, strip):
+    if isinstance(attributes, dict):
+        attributes = tuple(sorted(
+            (tag, tuple(attrs) if isinstance(attrs, (list, tuple)) else attrs)
+            for tag, attrs in attributes.items()))
+    elif isinstance(attributes, list):
+        attributes = frozenset(attributes)
+    return (frozenset(tags), attributes, strip)
+
+
+def _get_html_cleaner(key):
+    cleaners = getattr(_HTML_CLEANERS, 'cleaners', None)
+    if cleaners is None:
+        cleaners = {}
+        _HTML_CLEANERS.cleaners = cleaners
+    cleaner = cleaners.get(key)
+    if cleaner is None:
+        tags, attributes, strip = key
+        if isinstance(attributes, tuple):
+            attributes = {tag: list(attrs) if isinstance(attrs, tuple)
+                else attrs for tag, attrs in attributes}
+        elif isinstance(attributes, frozenset):
+            attributes = list(attributes)
+        cleaner = bleach.Cleaner(tags=tags, attributes=attributes, strip=strip)
+        cleaners[key] = cleaner
+    return cleaner
+
+
+@functools.lru_cache(maxsize=256)
+def _clean_html(text, key):
+    return _get_html_cleaner(key).clean(text)
+
+
 class HTMLField(serializers.CharField):
 
     def __init__(self, **kwargs):
@@ -66,7 +131,7 @@ class HTMLField(serializers.CharField):
 
     def to_internal_value(self, data):
         return super(HTMLField, self).to_internal_value(
-            bleach.clean(data,
+            clean_html(data,
                 tags=self.html_tags,
                 attributes=self.html_attributes,
                 strip=self.html_strip))
@@ -148,16 +213,16 @@ class NodeElementSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_extra(obj):
+        try:
+            # ``PageElement`` caches the decoded `extra` field.
+            return obj.extra_data
+        except AttributeError:
+            pass
         try:
             extra = obj.extra
         except AttributeError:
             extra = obj.get('extra', {})
-        if not isinstance(extra, dict):
-            try:
-                return json.loads(extra)
-            except (TypeError, ValueError):
-                pass
-        return extra
+        return loads_extra(extra)
 
     @staticmethod
     def get_indent(obj):
@@ -197,6 +262,24 @@ class NodeElementCreateSerializer(NodeElementSerializer):
         """
 
 
+class PageElementListSerializer(serializers.ListSerializer):
+    """
+    Decorates all `PageElement` in a list with reactions before
+    serializing them, so the number of queries does not grow
+    with the number of elements.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        data = list(data)
+        request = self.context.get('request')
+        PageElement.objects.annotate_reactions(data,
+            user=request.user if request and is_authenticated(request)
+            else None)
+        return super(PageElementListSerializer, self).to_representation(data)
+
+
 class PageElementSerializer(serializers.ModelSerializer):
     """
     Serializes a short summary of a `PageElement`
@@ -214,9 +297,9 @@ class PageElementSerializer(serializers.ModelSerializer):
         help_text=_("Format of the content, HTML or MD"))
     extra = ExtraField(required=False, allow_null=True,
         help_text=_("Extra meta data (can be stringify JSON)"))
-    nb_upvotes = serializers.IntegerField(required=False,
+    nb_upvotes = serializers.IntegerField(required=False, read_only=True,
         help_text=_("Number of times the content has been upvoted"))
-    nb_followers = serializers.IntegerField(required=False,
+    nb_followers = serializers.IntegerField(required=False, read_only=True,
         help_text=_("Number of followers notified when content is updated"))
     # The following fields will be set when a request user is authenticated.
     upvote = serializers.SerializerMethodField(required=False, allow_null=True,
@@ -239,70 +322,40 @@ class PageElementSerializer(serializers.ModelSerializer):
         read_only_fields = ('slug', 'account', 'text_updated_at',
             'nb_upvotes', 'nb_followers', 'upvote', 'follow',
             'last_read_at', 'nb_comments_since_last_read')
+        list_serializer_class = PageElementListSerializer
 
 
-    def get_upvote(self, data):
+    def to_representation(self, instance):
+        if isinstance(instance, PageElement):
+            PageElement.objects.annotate_reactions(
+                [instance], user=self._get_request_user())
+        return super(PageElementSerializer, self).to_representation(instance)
+
+    def _get_request_user(self):
         request = self.context.get('request')
         if request and is_authenticated(request):
-            if isinstance(data, PageElement):
-                if hasattr(data, 'vote'):
-                    return data.vote
-                pk = getattr(data, 'pk')
-                if not pk:
-                    return 0
-                vote = Vote.objects.filter(
-                    user=request.user, element=data).first()
-                return vote and vote.vote == Vote.UP_VOTE
+            return request.user
+        return None
+
+    def get_upvote(self, data):
+        if self._get_request_user() and isinstance(data, PageElement):
+            return data.vote
         return None
 
     def get_follow(self, data):
-        request = self.context.get('request')
-        if request and is_authenticated(request):
-            if isinstance(data, PageElement):
-                if hasattr(data, 'follow'):
-                    return data.follow
-                pk = getattr(data, 'pk')
-                if not pk:
-                    return 0
-                return Follow.objects.filter(
-                    user=request.user, element=data).exists()
+        if self._get_request_user() and isinstance(data, PageElement):
+            return data.follow
         return None
 
     def get_last_read_at(self, data):
-        request = self.context.get('request')
-        if request and is_authenticated(request):
-            if isinstance(data, PageElement):
-                if hasattr(data, 'nb_comments_since_last_read'):
-                    return data.nb_comments_since_last_read
-                pk = getattr(data, 'pk')
-                if not pk:
-                    return None
-                last_read_at = Follow.objects.filter(
-                    user=request.user, element=data).values(
-                    'last_read_at').first()
-                return last_read_at
+        if self._get_request_user() and isinstance(data, PageElement):
+            return data.last_read_at
         return None
 
     def get_nb_comments_since_last_read(self, data):
-        nb_comments = 0
-        request = self.context.get('request')
-        if request and is_authenticated(request):
-            if isinstance(data, PageElement):
-                if hasattr(data, 'nb_comments_since_last_read'):
-                    return data.nb_comments_since_last_read
-                last_read_at_qs = self.get_last_read_at(data)
-                comment_kwargs = {}
-                if last_read_at_qs:
-                    last_read_at = last_read_at_qs.get('last_read_at')
-                    if last_read_at:
-                        comment_kwargs.update({
-                            'element__text_updated_at__gt': last_read_at
-                        })
-                pk = getattr(data, 'pk')
-                if pk:
-                    nb_comments = Comment.objects.filter(user=request.user,
-                        element=data, **comment_kwargs).count()
-        return nb_comments
+        if self._get_request_user() and isinstance(data, PageElement):
+            return data.nb_comments_since_last_read
+        return 0
 
 
 class PageElementDetailSerializer(PageElementSerializer):
@@ -314,9 +367,7 @@ class PageElementDetailSerializer(PageElementSerializer):
     text = serializers.CharField(
         required=False,
         help_text=_("Long description of the page element"))
-    html_formatted = HTMLField(required=False,
-        html_tags=settings.ALLOWED_TAGS,
-        html_attributes=settings.ALLOWED_ATTRIBUTES,
+    html_formatted = serializers.CharField(read_only=True,
         help_text=_("Text field formatted as HTML"))
     count = serializers.IntegerField(required=False)
     results = serializers.ListField(required=False,
@@ -333,7 +384,7 @@ class PageElementDetailSerializer(PageElementSerializer):
     def get_path(self, obj):
         prefix = self.context.get('prefix', "")
         if not prefix:
-            parents = obj.get_parent_paths()
+            parents = obj.get_parent_paths(limit=1)
             if parents:
                 prefix = "/".join(
                     [parent.slug for parent in parents[0][:-1]])
@@ -349,12 +400,18 @@ class PageElementDetailSerializer(PageElementSerializer):
     def to_internal_value(self, data):
         data = data.copy()
         content_format = data.get('content_format')
-        if content_format == 'HTML':
-            # If content_format is HTML, we sanitize the text using
-            # HTMLField
-            html_field = HTMLField(html_tags=settings.ALLOWED_TAGS,
-                                   html_attributes=settings.ALLOWED_ATTRIBUTES)
-            data['text'] = html_field.to_internal_value(data['text'])
+        text = data.get('text')
+        if content_format == 'HTML' and text is not None:
+            # If content_format is HTML, we sanitize the text, unless
+            # it is the text already stored (ex: a round-trip from
+            # the editor with only the title updated).
+            if not (self.instance is not None
+                    and isinstance(self.instance, PageElement)
+                    and self.instance.content_format == 'HTML'
+                    and text == self.instance.text):
+                data['text'] = clean_html(text,
+                    tags=settings.ALLOWED_TAGS,
+                    attributes=settings.ALLOWED_ATTRIBUTES)
         return super(PageElementDetailSerializer, self).to_internal_value(data)
 
 
@@ -362,9 +419,7 @@ class UserNewsSerializer(PageElementSerializer):
     """
     Serializer for news updates
     """
-    descr = HTMLField(required=False,
-        html_tags=settings.ALLOWED_TAGS,
-        html_attributes=settings.ALLOWED_ATTRIBUTES,
+    descr = serializers.CharField(read_only=True,
         help_text=_("first paragraph of HTML-formatted content"))
 
     class Meta(PageElementSerializer.Meta):
@@ -373,11 +428,23 @@ class UserNewsSerializer(PageElementSerializer):
             'descr',)
 
 
-class PageElementTagSerializer(serializers.ModelSerializer):
+class PageElementTagSerializer(NoModelSerializer):
 
-    class Meta:
-        model = PageElement
-        fields = ('tag',)
+    tag = serializers.CharField(write_only=True,
+        help_text=_("Comma-separated list of tags"))
+
+    def validate_tag(self, value):
+        tags = [tag.strip() for tag in value.split(',') if tag.strip()]
+        if not tags:
+            raise serializers.ValidationError(
+                _("at least one tag is required"))
+        return tags
+
+
+class PageElementImportSerializer(NoModelSerializer):
+
+    file = serializers.FileField(write_only=True,
+        help_text=_("JSON Lines file describing content trees"))
 
 
 class EnumeratedElementSerializer(serializers.ModelSerializer):
@@ -463,6 +530,28 @@ class EnumeratedProgressSerializer(EnumeratedElementSerializer):
             'certificate', 'viewing_duration',)
 
 
+class EnumeratedProgressPingSerializer(NoModelSerializer):
+    """
+    Time spent by a user on an element of a sequence
+    """
+    user = serializers.SlugField(
+        help_text=_("Username of the user who viewed the material"))
+    sequence = serializers.SlugField(
+        help_text=_("Unique identifier for the sequence"))
+    rank = serializers.IntegerField(
+        help_text=_("Rank of the element in the sequence"))
+    elapsed = serializers.DurationField(
+        help_text=_("Time to add to the viewing duration (in hh:mm:ss)"))
+    viewing_duration = serializers.DurationField(read_only=True,
+        help_text=_("Time spent by the user on the material (in hh:mm:ss)"))
+
+    def validate_elapsed(self, value):
+        if value < timedelta():
+            raise serializers.ValidationError(
+                _("elapsed time cannot be negative"))
+        return value
+
+
 class ValidationErrorSerializer(NoModelSerializer):
     """
     Details when an error occurs
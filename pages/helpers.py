@@ -50,18 +50,43 @@ class ContentCut(object):
         #pylint:disable=unused-argument
         return True
 
+    def get_cache_key(self):
+        """
+        Returns a value identifying the cut in the key of cached content
+        trees. Subclasses whose behavior depends on more than `match`
+        should override it.
+        """
+        return "%s.%s:%s" % (self.__class__.__module__,
+            self.__class__.__qualname__, self.match)
+
+
+def loads_extra(extra):
+    """
+    Returns the `extra` field decoded from stringified JSON, or *extra*
+    as-is when it was already decoded (ex: ``EXTRA_FIELD`` is a JSONField)
+    or is not valid JSON.
+    """
+    if isinstance(extra, six.string_types):
+        try:
+            return json.loads(extra)
+        except (TypeError, ValueError):
+            pass
+    return extra
+
 
 def get_extra(obj, attr_name, default=None):
     try:
-        if isinstance(obj.extra, six.string_types):
-            try:
-                obj.extra = json.loads(obj.extra)
-            except (TypeError, ValueError):
-                return default
-        extra = obj.extra
+        # ``PageElement`` caches the decoded `extra` field.
+        extra = obj.extra_data
     except AttributeError:
-        extra = obj.get('extra')
-    return extra.get(attr_name, default) if extra else default
+        try:
+            extra = obj.extra
+        except AttributeError:
+            extra = obj.get('extra')
+        extra = loads_extra(extra)
+    if not isinstance(extra, dict):
+        return default
+    return extra.get(attr_name, default)
 
 
 def update_context_urls(context, urls):
@@ -0,0 +1,69 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import PageElement
+from ...transfer import export_content_tree
+
+
+class Command(BaseCommand):
+    """
+    Writes the content trees rooted at the page elements listed
+    on the command line (all roots of the content DAG by default)
+    as JSON Lines, such that they can be loaded back
+    with ``import_content_tree``.
+    """
+    help = "Exports content trees as JSON Lines"
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('slugs', metavar='slug', nargs='*',
+            help='slug of a page element at the root of an exported tree')
+        parser.add_argument('--output',
+            action='store', dest='output', default=None,
+            help='file the lines are written to (defaults to stdout)')
+        parser.add_argument('--batch-size',
+            action='store', dest='batch_size', type=int, default=100,
+            help='number of page elements loaded per query')
+
+    def handle(self, *args, **options):
+        roots = None
+        if options['slugs']:
+            elements = {element.slug: element
+                for element in PageElement.objects.filter(
+                    slug__in=options['slugs'])}
+            missing = [slug for slug in options['slugs']
+                if slug not in elements]
+            if missing:
+                raise CommandError(
+                    "no page elements with slugs %s" % ", ".join(missing))
+            roots = [elements[slug] for slug in options['slugs']]
+        lines = export_content_tree(roots, batch_size=options['batch_size'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
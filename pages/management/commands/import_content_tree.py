@@ -0,0 +1,85 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from ... import settings
+from ...models import PageElement
+from ...transfer import import_content_tree
+from ...utils import get_account_model
+
+
+class Command(BaseCommand):
+    """
+    Creates the content trees described in a JSON Lines file,
+    as written by ``export_content_tree``.
+
+    Page elements and edges are inserted in bulk. The closure table,
+    tags, search index and root/leaf flags are updated accordingly.
+    """
+    help = "Imports content trees from JSON Lines"
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('path',
+            help='JSON Lines file describing the content trees')
+        parser.add_argument('--parent',
+            action='store', dest='parent', default=None,
+            help='slug of the page element the imported roots are'\
+            ' attached under')
+        parser.add_argument('--account',
+            action='store', dest='account', default=None,
+            help='account owning the imported page elements')
+        parser.add_argument('--batch-size',
+            action='store', dest='batch_size', type=int, default=1000,
+            help='number of lines inserted per query')
+
+    def handle(self, *args, **options):
+        parent = None
+        if options['parent']:
+            try:
+                parent = PageElement.objects.get(slug=options['parent'])
+            except PageElement.DoesNotExist:
+                raise CommandError(
+                    "no page element with slug %s" % options['parent'])
+        account = None
+        if options['account']:
+            account_model = get_account_model()
+            try:
+                account = account_model.objects.get(**{
+                    settings.ACCOUNT_LOOKUP_FIELD: options['account']})
+            except account_model.DoesNotExist:
+                raise CommandError(
+                    "no account with %s %s" % (
+                    settings.ACCOUNT_LOOKUP_FIELD, options['account']))
+        try:
+            with open(options['path']) as lines:
+                roots = import_content_tree(lines, parent=parent,
+                    account=account, batch_size=options['batch_size'])
+        except ValidationError as err:
+            raise CommandError(err.detail.get('detail', err.detail)
+                if isinstance(err.detail, dict) else err.detail)
+        self.stdout.write("%d content trees imported (%s)" % (
+            len(roots), ", ".join([root.slug for root in roots])))
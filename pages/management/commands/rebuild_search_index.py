@@ -0,0 +1,54 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.management.base import BaseCommand
+
+from ...models import PageElement
+from ...search import get_search_engine
+
+
+class Command(BaseCommand):
+    """
+    Indexes all ``PageElement`` in the search engine selected
+    by the ``SEARCH_ENGINE`` setting.
+
+    The index is kept in sync whenever a ``PageElement`` is saved
+    or deleted. This command creates the index tables when necessary
+    and is used to populate them on an existing database, before setting
+    ``SEARCH_ENGINE`` to 'fulltext'.
+    """
+    help = "Recomputes the full-text search index of page elements"
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--batch-size',
+            action='store', dest='batch_size', type=int, default=1000,
+            help='number of page elements indexed per query')
+
+    def handle(self, *args, **options):
+        queryset = PageElement.objects.all()
+        search_engine = get_search_engine()
+        search_engine.create_index()
+        search_engine.rebuild(queryset, batch_size=options['batch_size'])
+        self.stdout.write("%d page elements indexed" % queryset.count())
@@ -0,0 +1,57 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from ...models import Follow, PageElement, Vote
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the denormalized ``nb_upvotes`` and ``nb_followers``
+    counters of ``PageElement`` from the ``Vote`` and ``Follow`` tables.
+
+    The counters are kept in sync by signals whenever a ``Vote``
+    or ``Follow`` is saved or deleted, including deletes in cascade with
+    a user. This command is used to populate them on an existing database,
+    or after votes and follows were changed through bulk queries
+    (ex: ``QuerySet.update``).
+    """
+    help = "Recomputes the number of upvotes and followers of page elements"
+
+    def handle(self, *args, **options):
+        nb_upvotes = Vote.objects.filter(element=OuterRef('pk'),
+            vote=Vote.UP_VOTE).order_by().values('element').annotate(
+            count=Count('pk')).values('count')
+        nb_followers = Follow.objects.filter(
+            element=OuterRef('pk')).order_by().values('element').annotate(
+            count=Count('pk')).values('count')
+        nb_updated = PageElement.objects.update(
+            nb_upvotes=Coalesce(
+                Subquery(nb_upvotes, output_field=IntegerField()), 0),
+            nb_followers=Coalesce(
+                Subquery(nb_followers, output_field=IntegerField()), 0))
+        self.stdout.write("%d page elements updated" % nb_updated)
@@ -170,10 +170,10 @@ class TrailMixin(object):
         if not hasattr(self, '_breadcrumbs'):
             self._breadcrumbs = []
             parts = self.path.strip(self.URL_PATH_SEP).split(self.URL_PATH_SEP)
-            title_by_slug = dict(PageElement.objects.filter(
-                slug__in=parts).values_list('slug', 'title'))
+            elements_by_slug = self.get_elements_by_slug(parts)
             for idx, part in enumerate(parts):
-                title = title_by_slug.get(part)
+                element = elements_by_slug.get(part)
+                title = element.title if element else None
                 if title:
                     url_kwargs = self.get_url_kwargs()
                     url_kwargs.update({
@@ -197,8 +197,10 @@ class TrailMixin(object):
                 self._element = None
             else:
                 parts = path.split(self.URL_PATH_SEP)
-                self._element = get_object_or_404(
-                    PageElement.objects.all(), slug=parts[-1])
+                self._element = self.get_elements_by_slug(parts).get(
+                    parts[-1])
+                if not self._element:
+                    raise Http404("%s could not be found." % path)
         return self._element
 
     @property
@@ -225,9 +227,13 @@ class TrailMixin(object):
         results = []
         parts = path.strip(self.URL_PATH_SEP).split(self.URL_PATH_SEP)
         if parts:
-            element = get_object_or_404(
-                PageElement.objects.all(), slug=parts[-1])
-            candidates = element.get_parent_paths(hints=parts[:-1])
+            elements_by_slug = self.get_elements_by_slug(parts)
+            element = elements_by_slug.get(parts[-1])
+            if not element:
+                raise Http404("%s could not be found." % path)
+            # We only need to know if there is more than one candidate.
+            candidates = element.get_parent_paths(hints=parts[:-1],
+                limit=2, elements=elements_by_slug.values())
             if not candidates:
                 raise Http404("%s could not be found." % path)
             # XXX Implementation Note: if we have multiple candidates,
@@ -240,6 +246,31 @@ class TrailMixin(object):
             results = candidates[0]
         return results
 
+    def get_elements_by_slug(self, slugs):
+        """
+        Returns a dictionary of `PageElement` indexed by slug for all
+        *slugs* that exist in the database.
+
+        `PageElement` are kept in an identity map for the duration
+        of the request such that each slug is only looked up once.
+        """
+        lookup_slugs = slugs
+        if not hasattr(self, '_elements_by_slug'):
+            # All slugs in the URL path are resolved in a single query.
+            self._elements_by_slug = {}
+            lookup_slugs = list(slugs) + self.path.strip(
+                self.URL_PATH_SEP).split(self.URL_PATH_SEP)
+        missing_slugs = set([slug for slug in lookup_slugs
+            if slug and slug not in self._elements_by_slug])
+        if missing_slugs:
+            for element in PageElement.objects.filter(slug__in=missing_slugs):
+                self._elements_by_slug[element.slug] = element
+            for slug in missing_slugs:
+                # Remembers slugs that do not exist as well.
+                self._elements_by_slug.setdefault(slug, None)
+        return {slug: self._elements_by_slug[slug]
+            for slug in slugs if slug and self._elements_by_slug.get(slug)}
+
     def get_query_param(self, key, default_value=None):
         try:
             return self.request.query_params.get(key, default_value)
@@ -24,25 +24,219 @@
 
 from __future__ import unicode_literals
 
-import datetime, json, logging, random
+import atexit, datetime, functools, hashlib, itertools, json, logging
+import random, re, sys, threading, time, types
 from collections import OrderedDict
+from html.parser import HTMLParser
 
 import markdown
 from bs4 import BeautifulSoup
 from deployutils.helpers import datetime_or_now
 from django.contrib.auth import get_user_model
-from django.db import IntegrityError, models, transaction
-from django.db.models import Max, Q
+from django.core.cache import caches
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.template.defaultfilters import slugify
 from rest_framework.exceptions import ValidationError
 
 from . import settings
 from .compat import (gettext_lazy as _, import_string,
     python_2_unicode_compatible, reverse, six)
+from .helpers import ContentCut, loads_extra
+from .search import get_search_engine
 
 
 LOGGER = logging.getLogger(__name__)
 
+CONTENT_TREE_CACHE_KEY_PREFIX = 'pages:content_tree'
+CONTENT_TREE_VERSION_KEY = '%s:version' % CONTENT_TREE_CACHE_KEY_PREFIX
+
+# In-memory parent index, valid as long as the content tree version
+# does not change.
+_PARENT_INDEX = {}
+
+# Each thread reuses the same `markdown.Markdown` instance.
+_MARKDOWN = threading.local()
+
+# Write-behind buffer of progress pings (see `PING_FLUSH_INTERVAL`).
+_PING_BUFFER = {
+    'lock': threading.Lock(),
+    'flushed_at': time.monotonic(),
+    'pending': {},         # pk -> (`EnumeratedProgress`, increment)
+    'progress_by_key': {}, # ping key -> `EnumeratedProgress`
+    'flusher': None        # thread flushing pending increments periodically
+}
+# Last ping time of a buffered `EnumeratedProgress` shared across processes.
+PING_TIME_KEY = 'pages:last_ping_time:%d'
+
+
+_FRAMESET_RE = re.compile(r'<frameset', re.IGNORECASE)
+
+
+class _FirstParagraphFound(Exception):
+    pass
+
+
+class _FirstParagraphFinder(HTMLParser):
+    """
+    Finds the position of the first paragraph in an HTML document,
+    without parsing the remaining of the document.
+
+    The paragraph is flagged as unsupported whenever it is not obvious
+    an HTML5 parser would parse it the same way out of the document.
+    """
+    # Start tags that implicitly close an open paragraph.
+    CLOSING_TAGS = frozenset(['address', 'article', 'aside', 'blockquote',
+        'dd', 'details', 'dialog', 'div', 'dl', 'dt', 'fieldset',
+        'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4',
+        'h5', 'h6', 'header', 'hgroup', 'hr', 'li', 'main', 'menu', 'nav',
+        'ol', 'p', 'pre', 'section', 'ul'])
+    # Formatting tags are re-opened inside a paragraph.
+    FORMATTING_TAGS = frozenset(['a', 'b', 'big', 'code', 'em', 'font', 'i',
+        'nobr', 's', 'small', 'strike', 'strong', 'tt', 'u'])
+    # Raw text elements the parser only knows about when they are not
+    # self-closing (ex: `<script/>` starts a script in HTML5).
+    RAW_TEXT_TAGS = frozenset(['script', 'style'])
+    # Tags whose content is not parsed as in the rest of the document,
+    # or that change the scope paragraphs are closed in (ex: `button`).
+    UNSUPPORTED_TAGS = frozenset(['applet', 'button', 'frameset', 'iframe',
+        'marquee', 'math', 'noembed', 'noframes', 'noscript', 'object',
+        'plaintext', 'select', 'svg', 'table', 'template', 'textarea',
+        'title', 'xmp'])
+    VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img',
+        'input', 'link', 'meta', 'source', 'track', 'wbr'])
+
+    def __init__(self):
+        super(_FirstParagraphFinder, self).__init__(convert_charrefs=False)
+        self.start = None
+        self.end = None
+        self.unsupported = False
+        self.ancestors = []
+        self.open_tags = []
+
+    def _stop(self, unsupported=False):
+        if unsupported:
+            self.unsupported = True
+        else:
+            self.end = self.getpos()
+        raise _FirstParagraphFound()
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.UNSUPPORTED_TAGS:
+            self._stop(unsupported=True)
+        if self.start is None:
+            if tag == 'p':
+                if self.FORMATTING_TAGS & set(self.ancestors):
+                    self._stop(unsupported=True)
+                self.start = self.getpos()
+            elif tag not in self.VOID_TAGS:
+                self.ancestors += [tag]
+        elif tag in self.CLOSING_TAGS:
+            self._stop()
+        elif tag not in self.VOID_TAGS:
+            self.open_tags += [tag]
+
+    def handle_startendtag(self, tag, attrs):
+        # HTML5 parsers ignore the self-closing flag on elements that
+        # are not void (ex: `<p/>` opens a paragraph).
+        if tag in self.RAW_TEXT_TAGS:
+            self._stop(unsupported=True)
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self.start is None:
+            if self.ancestors and self.ancestors[-1] == tag:
+                self.ancestors.pop()
+            else:
+                # Stray end tags (ex: `</p>` creates an empty paragraph).
+                self._stop(unsupported=True)
+        elif tag == 'p':
+            self._stop()
+        elif self.open_tags and self.open_tags[-1] == tag:
+            self.open_tags.pop()
+        elif (tag in self.ancestors and tag in self.CLOSING_TAGS
+              and tag not in self.open_tags):
+            self._stop()
+        else:
+            # Misnested or stray end tags.
+            self._stop(unsupported=True)
+
+
+def get_first_paragraph(html):
+    """
+    Returns the HTML fragment that contains the first paragraph of *html*,
+    an empty string if there are none, or *html* itself when
+    the paragraph cannot be found without parsing the whole document.
+    """
+    if _FRAMESET_RE.search(html):
+        # A `frameset` anywhere in the document can discard the body
+        # the paragraph is in.
+        return html
+    finder = _FirstParagraphFinder()
+    try:
+        finder.feed(html)
+        finder.close()
+    except _FirstParagraphFound:
+        pass
+    if finder.unsupported:
+        return html
+    if finder.start is None:
+        return ""
+    line_offsets = [0]
+    for line in html.split('\n'):
+        line_offsets += [line_offsets[-1] + len(line) + 1]
+    start = line_offsets[finder.start[0] - 1] + finder.start[1]
+    end = (line_offsets[finder.end[0] - 1] + finder.end[1]
+        if finder.end else len(html))
+    return html[start:end]
+
+
+def get_descr(html, slug):
+    """
+    Returns an excerpt of the first paragraph in *html* followed
+    by a link to read more on the page element *slug*.
+    """
+    return _get_descr(html, reverse('pages_element', args=(slug,)))
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_descr(html, href):
+    #pylint:disable=too-many-nested-blocks
+    soup = BeautifulSoup(get_first_paragraph(html), 'html5lib')
+    descr = soup.find('p')
+    if descr:
+        nb_available_characters = 5 * 60 # 5 lines of 60 characters
+        short_descr = soup.new_tag(name='p')
+        for child in descr.children:
+            if child.name:
+                nb_available_characters -= len(child.text)
+                short_descr.append(child)
+            else:
+                child_text = child.text
+                child_text_len = len(child_text)
+                if nb_available_characters < child_text_len:
+                    for idx in range(nb_available_characters - 1, 0, -1):
+                        if child.text[idx] == " ":
+                            break
+                        nb_available_characters -= 1
+                    child_text = child.text[:nb_available_characters]
+                    nb_available_characters -= nb_available_characters
+                else:
+                    nb_available_characters -= child_text_len
+                short_descr.append(child_text)
+            if nb_available_characters < 0:
+                break
+
+        # `string=` requires BeautifulSoup4>=4.13
+        tag = soup.new_tag(name='a', href=href)
+        tag.append("... read more")
+        short_descr.append(tag)
+        return str(short_descr)
+    return ""
+
 
 def get_extra_field_class():
     extra_class = settings.EXTRA_FIELD
@@ -53,43 +247,130 @@ def get_extra_field_class():
     return extra_class
 
 
+@functools.lru_cache(maxsize=256)
+def render_markdown(text):
+    """
+    Returns *text* formatted as HTML.
+
+    The HTML is memoized by *text* so elements with the same text are only
+    rendered once per process.
+    """
+    renderer = getattr(_MARKDOWN, 'renderer', None)
+    if renderer is None:
+        renderer = markdown.Markdown(extensions=['tables'])
+        _MARKDOWN.renderer = renderer
+    return renderer.reset().convert(text)
+
+
 class RelationShipManager(models.Manager):
 
     def insert_available_rank(self, root, pos=0, node=None):
-        # Implementation Note:
-        #   Edges are ordered loosily. That is: only when a node is specified
-        #   to be at a specific position in the outbound adjency list from
-        #   an origin node will ranks be computed. By default all ranks
-        #   are zero.
-        #   This means we can end-up in the following situations before
-        #   inserting a node:
-        #      (sort order 0 1 2 3 4 5 6)
-        #   1. rank        0 0 0 0 0 0 0
-        #   2. rank        6 6 6 6 6 6 6
-        #   insertion pos      ^
-        #   The resulting ranks must keep the current order yet leave
-        #   a hole to insert the new node.
-        #   1. new rank    0 0 3 4 5 6 7
-        #   2. new rank    0 1 6 6 6 6 6
-        sorted_edges = list(self.filter(orig_element=root).order_by(
-            'rank', 'pk'))
+        """
+        Makes room for an edge at position *pos* in the list of outbound
+        edges from *root* and returns the rank to give to that edge.
 
+        When *node* is specified, its edge from *root* is the one being
+        moved, so it is not counted when positions are computed.
+        """
+        # Implementation Note:
+        #   Ranks are spaced by `RANK_GAP` such that an edge can usually
+        #   be inserted in between two others by picking the rank halfway.
+        #   Ranks can also tie (ex: by default all ranks are zero), in which
+        #   case edges are ordered by primary key. Only when there is no room
+        #   left between the neighbours will the edges after the insertion
+        #   point be shifted, through a single `UPDATE`.
+        #      (sort order   0    1    2    3)
+        #   1. rank          0 1024 2048 3072
+        #   insertion pos             ^ new edge has rank 1536
+        #   2. rank          0    0    0    0
+        #   insertion pos             ^ new edge has rank 512
+        #      new rank      0    0 1024 1024
+        sorted_edges = self.filter(orig_element=root)
         if node:
-            for index, edge in enumerate(sorted_edges):
-                if edge.dest_element_id == node.pk:
-                    prev_pos = index
-                    break
-            if prev_pos < pos:
-                pos = pos + 1
-
-        for index, edge in enumerate(sorted_edges[:pos]):
-            if edge.rank >= pos:
-                edge.rank = index
-                edge.save()
-        for index, edge in enumerate(sorted_edges[pos:]):
-            if edge.rank < (pos + index + 1):
-                edge.rank = pos + index + 1
-                edge.save()
+            sorted_edges = sorted_edges.exclude(dest_element=node)
+        sorted_edges = list(sorted_edges.order_by('rank', 'pk').values_list(
+            'pk', 'rank'))
+        pos = max(0, min(pos, len(sorted_edges)))
+        prev_edge = sorted_edges[pos - 1] if pos > 0 else None
+        next_edge = sorted_edges[pos] if pos < len(sorted_edges) else None
+        if next_edge is None:
+            return prev_edge[1] + RelationShip.RANK_GAP if prev_edge else 0
+        if prev_edge is None:
+            return next_edge[1] - RelationShip.RANK_GAP
+        prev_pk, prev_rank = prev_edge
+        if next_edge[1] - prev_rank < 2:
+            after_prev_q = (Q(rank__gt=prev_rank) |
+                Q(rank=prev_rank, pk__gt=prev_pk))
+            edges = self.filter(after_prev_q, orig_element=root)
+            if node:
+                edges = edges.exclude(dest_element=node)
+            with transaction.atomic():
+                RelationShipClosure.objects.filter(
+                    edge__in=edges.values('pk')).update(
+                    rank=models.F('rank') + RelationShip.RANK_GAP)
+                edges.update(rank=models.F('rank') + RelationShip.RANK_GAP)
+            invalidate_content_tree()
+            next_edge = (next_edge[0], next_edge[1] + RelationShip.RANK_GAP)
+        return (prev_rank + next_edge[1]) // 2
+
+    def get_parent_index(self, pks=None):
+        """
+        Returns a dictionary that maps the primary key of a ``PageElement``
+        to the list of primary keys of its parents in the content DAG.
+
+        When the ``CONTENT_TREE_CACHE`` setting is defined, the index
+        of the whole content DAG is built in a single query and kept
+        in memory until the content tree version changes. Otherwise,
+        when *pks* is specified, the index only covers the ancestors
+        of the page elements in *pks*.
+        """
+        cache = get_content_tree_cache()
+        version = None
+        if cache is not None:
+            version = get_content_tree_version(cache)
+            snapshot = _PARENT_INDEX.get('snapshot')
+            if snapshot and snapshot[0] == version:
+                return snapshot[1]
+        elif pks is not None:
+            return self._get_ancestors_parent_index(pks)
+        parent_index = {}
+        for dest_element_id, orig_element_id in self.all().values_list(
+                'dest_element_id', 'orig_element_id').order_by(
+                'dest_element_id', 'orig_element_id'):
+            parent_index.setdefault(dest_element_id, []).append(
+                orig_element_id)
+        if version is not None:
+            _PARENT_INDEX['snapshot'] = (version, parent_index)
+        return parent_index
+
+    def _get_ancestors_parent_index(self, pks):
+        parent_index = {}
+        if settings.CONTENT_TREE_ENGINE == 'closure':
+            # All edges leading to *pks* are found in a single query.
+            edges = self.filter(Q(dest_element_id__in=pks) |
+                Q(dest_element_id__in=RelationShipClosure.objects.filter(
+                    descendant_id__in=pks).values('ancestor_id')))
+            for dest_element_id, orig_element_id in edges.values_list(
+                    'dest_element_id', 'orig_element_id').order_by(
+                    'dest_element_id', 'orig_element_id'):
+                parent_index.setdefault(dest_element_id, []).append(
+                    orig_element_id)
+            return parent_index
+        # Otherwise we walk up the content DAG one level at a time.
+        frontier = set(pks)
+        visited = set(frontier)
+        while frontier:
+            edges = self.filter(dest_element_id__in=frontier).values_list(
+                'dest_element_id', 'orig_element_id').order_by(
+                'dest_element_id', 'orig_element_id')
+            frontier = set([])
+            for dest_element_id, orig_element_id in edges:
+                parent_index.setdefault(dest_element_id, []).append(
+                    orig_element_id)
+                if orig_element_id not in visited:
+                    visited |= set([orig_element_id])
+                    frontier |= set([orig_element_id])
+        return parent_index
 
     def insert_node(self, root, node, pos=0):
         """
@@ -97,8 +378,8 @@ class RelationShipManager(models.Manager):
         edges from *root*.
         """
         with transaction.atomic():
-            self.insert_available_rank(root, pos=pos)
-            self.create(orig_element=root, dest_element=node, rank=pos)
+            rank = self.insert_available_rank(root, pos=pos)
+            self.create(orig_element=root, dest_element=node, rank=rank)
 
 
 @python_2_unicode_compatible
@@ -108,6 +389,10 @@ class RelationShip(models.Model):
     """
     objects = RelationShipManager()
 
+    # Space left between the ranks of consecutive edges such that
+    # an edge can be inserted in between without renumbering.
+    RANK_GAP = 1024
+
     orig_element = models.ForeignKey(
         "PageElement", on_delete=models.CASCADE, related_name='from_element')
     dest_element = models.ForeignKey(
@@ -122,6 +407,197 @@ class RelationShip(models.Model):
         return "%s to %s" % (
             self.orig_element.slug, self.dest_element.slug) #pylint: disable=no-member
 
+    def __init__(self, *args, **kwargs):
+        super(RelationShip, self).__init__(*args, **kwargs)
+        # Keeps track of the edge as it was loaded from the database
+        # such that moves can be reflected in `RelationShipClosure`.
+        self._original_edge = (
+            self.orig_element_id, self.dest_element_id, self.rank)
+
+
+class RelationShipClosureManager(models.Manager):
+
+    @staticmethod
+    def get_path(*pks):
+        return '/%s/' % '/'.join([str(pk) for pk in pks])
+
+    def insert_edge(self, edge):
+        """
+        Adds all paths going through *edge* to the closure table.
+        """
+        orig_element_id = edge.orig_element_id
+        dest_element_id = edge.dest_element_id
+        heads = [(orig_element_id, self.get_path(orig_element_id), 0)] + list(
+            self.filter(descendant_id=orig_element_id).values_list(
+            'ancestor_id', 'path', 'depth'))
+        tails = [(dest_element_id, self.get_path(dest_element_id), 0,
+            edge.pk, edge.rank)] + list(
+            self.filter(ancestor_id=dest_element_id).values_list(
+            'descendant_id', 'path', 'depth', 'edge_id', 'rank'))
+        self.bulk_create([self.model(
+            ancestor_id=ancestor_id, descendant_id=descendant_id,
+            path=head_path + tail_path[1:],
+            depth=head_depth + tail_depth + 1,
+            edge_id=edge_id, rank=rank)
+            for ancestor_id, head_path, head_depth in heads
+            for descendant_id, tail_path, tail_depth, edge_id, rank in tails])
+
+    def insert_subtree(self, edges):
+        """
+        Adds all paths made of *edges* to the closure table.
+
+        The origin of every edge in *edges* must not have any ancestors,
+        and a destination must not have any descendants unless it is also
+        the origin of an edge in *edges* (ex: a freshly copied subtree
+        not yet attached to the content DAG).
+        """
+        children = {}
+        for edge in edges:
+            children.setdefault(edge.orig_element_id, []).append(edge)
+        closures = []
+        for ancestor_id in children:
+            stack = [(ancestor_id, self.get_path(ancestor_id), 0)]
+            while stack:
+                orig_element_id, path, depth = stack.pop()
+                for edge in children.get(orig_element_id, []):
+                    dest_path = "%s%d/" % (path, edge.dest_element_id)
+                    closures += [self.model(ancestor_id=ancestor_id,
+                        descendant_id=edge.dest_element_id, path=dest_path,
+                        depth=depth + 1, edge_id=edge.pk, rank=edge.rank)]
+                    stack += [(edge.dest_element_id, dest_path, depth + 1)]
+        self.bulk_create(closures)
+
+    def delete_edge(self, orig_element_id, dest_element_id):
+        """
+        Removes all paths going through the edge
+        *orig_element_id* -> *dest_element_id* from the closure table.
+        """
+        ancestor_ids = [orig_element_id] + list(self.filter(
+            descendant_id=orig_element_id).values_list(
+            'ancestor_id', flat=True).distinct())
+        self.filter(ancestor_id__in=ancestor_ids,
+            path__contains=self.get_path(
+            orig_element_id, dest_element_id)).delete()
+
+    def get_descendant_paths(self, ancestor_id, descendant_ids):
+        """
+        Returns a dictionary of paths, as lists of `PageElement` primary keys
+        starting with *ancestor_id*, keyed by each of *descendant_ids*
+        that is a descendant of *ancestor_id*. When there are many paths
+        to a descendant, the shortest one is returned.
+        """
+        results = {}
+        for descendant_id, path in self.filter(ancestor_id=ancestor_id,
+                descendant_id__in=descendant_ids).values_list(
+                'descendant_id', 'path').order_by('depth', 'rank', 'edge_id'):
+            if descendant_id not in results:
+                results[descendant_id] = [
+                    int(pk) for pk in path.strip('/').split('/')]
+        return results
+
+    def rebuild(self, batch_size=1000):
+        """
+        Recomputes the closure table from the `RelationShip` edges.
+        """
+        children = {}
+        for edge in RelationShip.objects.all().order_by('rank', 'pk').values(
+                'pk', 'orig_element_id', 'dest_element_id', 'rank'):
+            children.setdefault(edge['orig_element_id'], []).append(edge)
+        with transaction.atomic():
+            self.all().delete()
+            closures = []
+            for ancestor_id in children:
+                stack = [(ancestor_id, self.get_path(ancestor_id), 0)]
+                while stack:
+                    orig_element_id, path, depth = stack.pop()
+                    for edge in children.get(orig_element_id, []):
+                        dest_element_id = edge['dest_element_id']
+                        dest_path = "%s%d/" % (path, dest_element_id)
+                        closures += [self.model(ancestor_id=ancestor_id,
+                            descendant_id=dest_element_id, path=dest_path,
+                            depth=depth + 1, edge_id=edge['pk'],
+                            rank=edge['rank'])]
+                        stack += [(dest_element_id, dest_path, depth + 1)]
+                    if len(closures) >= batch_size:
+                        self.bulk_create(closures)
+                        closures = []
+            if closures:
+                self.bulk_create(closures)
+
+
+@python_2_unicode_compatible
+class RelationShipClosure(models.Model):
+    """
+    Materialized paths between a ``PageElement`` and all its descendants
+    in the content DAG.
+
+    ``path`` is the list of ``PageElement`` primary keys, separated
+    by '/', from *ancestor* to *descendant*. ``edge`` and ``rank`` are those
+    of the last ``RelationShip`` on the path. Rows are kept in sync with
+    the ``RelationShip`` table such that a full subtree can be retrieved
+    in a single query.
+
+    Rows are maintained whatever the ``CONTENT_TREE_ENGINE`` setting is.
+    Searches are restricted to a subtree through this table, and switching
+    to the 'closure' engine does not require to rebuild it first.
+    """
+    objects = RelationShipClosureManager()
+
+    ancestor = models.ForeignKey("PageElement", on_delete=models.CASCADE,
+        related_name='descendant_paths')
+    descendant = models.ForeignKey("PageElement", on_delete=models.CASCADE,
+        related_name='ancestor_paths')
+    edge = models.ForeignKey(RelationShip, on_delete=models.CASCADE,
+        related_name='closures')
+    path = models.CharField(max_length=255, unique=True)
+    depth = models.PositiveIntegerField()
+    rank = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ancestor', 'depth', 'rank']),
+        ]
+
+    def __str__(self):
+        return str(self.path)
+
+
+@receiver(post_save, sender=RelationShip)
+def relationship_closure_on_save(sender, instance, created, **kwargs):
+    #pylint:disable=unused-argument,protected-access
+    orig_element_id, dest_element_id, rank = instance._original_edge
+    with transaction.atomic():
+        if created:
+            RelationShipClosure.objects.insert_edge(instance)
+            PageElement.objects.filter(pk=instance.orig_element_id).update(
+                is_leaf=False)
+            PageElement.objects.filter(pk=instance.dest_element_id).update(
+                is_root=False)
+        elif (orig_element_id != instance.orig_element_id or
+              dest_element_id != instance.dest_element_id):
+            RelationShipClosure.objects.delete_edge(
+                orig_element_id, dest_element_id)
+            RelationShipClosure.objects.insert_edge(instance)
+            PageElement.objects.update_roots_and_leafs(pks=[
+                orig_element_id, dest_element_id,
+                instance.orig_element_id, instance.dest_element_id])
+        elif rank != instance.rank:
+            RelationShipClosure.objects.filter(edge=instance).update(
+                rank=instance.rank)
+    instance._original_edge = (
+        instance.orig_element_id, instance.dest_element_id, instance.rank)
+    invalidate_content_tree()
+
+
+@receiver(post_delete, sender=RelationShip)
+def relationship_closure_on_delete(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    RelationShipClosure.objects.delete_edge(
+        instance.orig_element_id, instance.dest_element_id)
+    PageElement.objects.update_roots_and_leafs(pks=[
+        instance.orig_element_id, instance.dest_element_id])
+    invalidate_content_tree()
+
 
 @python_2_unicode_compatible
 class AbstractMediaTag(models.Model):
@@ -153,25 +629,19 @@ class PageElementQuerySet(models.QuerySet):
 
 class PageElementManager(models.Manager):
 
+    # Longest suffix appended to make a slug unique (ex: '-123456789').
+    MAX_SLUG_SUFFIX_LENGTH = 10
+
+    # Number of distinct slugs checked in a single query.
+    SLUG_BATCH_SIZE = 100
+
     def get_queryset(self):
         return PageElementQuerySet(self.model, using=self._db)
 
     def filter_available(self, visibility=None, accounts=None,
                          start_at=None, ends_at=None):
-        filtered_in = None
-        if visibility:
-            for visible in visibility:
-                visibility_q = Q(extra__contains=visible)
-                if filtered_in:
-                    filtered_in |= visibility_q
-                else:
-                    filtered_in = visibility_q
-        if accounts:
-            accounts_q = Q(account__slug__in=accounts)
-            if filtered_in:
-                filtered_in |= accounts_q
-            else:
-                filtered_in = accounts_q
+        filtered_in = _get_available_q(
+            visibility=visibility, accounts=accounts)
         queryset = self.filter(filtered_in) if filtered_in else self.all()
 
         filtered_dates = {}
@@ -183,23 +653,158 @@ class PageElementManager(models.Manager):
 
 
     def get_roots(self, visibility=None, accounts=None):
-        queryset = self.filter_available(
-            visibility=visibility, accounts=accounts).extra(where=[
-            '(SELECT COUNT(*) FROM pages_relationship'\
-            ' WHERE pages_relationship.dest_element_id = pages_pageelement.id)'\
-            ' = 0'])
-        return queryset
+        return self.filter_available(
+            visibility=visibility, accounts=accounts).filter(is_root=True)
 
     def get_leafs(self):
-        return self.all().extra(where=[
-            '(SELECT COUNT(*) FROM pages_relationship'\
-            ' WHERE pages_relationship.orig_element_id = pages_pageelement.id)'\
-            ' = 0'])
+        return self.filter(is_leaf=True)
+
+    def update_roots_and_leafs(self, pks=None):
+        """
+        Recomputes the `is_root` and `is_leaf` flags of page elements
+        in *pks* (all page elements when *pks* is `None`) from the edges
+        in the content DAG.
+        """
+        queryset = self.all() if pks is None else self.filter(pk__in=pks)
+        return queryset.update(
+            is_root=~models.Exists(RelationShip.objects.filter(
+                dest_element=models.OuterRef('pk'))),
+            is_leaf=~models.Exists(RelationShip.objects.filter(
+                orig_element=models.OuterRef('pk'))))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Inserts *objs* in the database, assigning a unique slug derived
+        from the title to each page element that does not have one yet.
+        """
+        objs = list(objs)
+        no_slugs = [obj for obj in objs if not obj.slug]
+        for obj, slug in zip(no_slugs,
+                self.get_unique_slugs([obj.title for obj in no_slugs])):
+            obj.slug = slug
+        return super(PageElementManager, self).bulk_create(
+            objs, *args, **kwargs)
+
+    def get_unique_slugs(self, titles, taken=None):
+        """
+        Returns a slug for each title in *titles*. The slugs are unique
+        amongst themselves and not used by any ``PageElement`` (nor listed
+        in *taken*) yet.
+
+        A slug is derived from the title. When it is already used,
+        the first available numbered suffix (ex: '-2', '-3') is appended.
+        """
+        #pylint:disable=too-many-locals
+        max_length = self.model._meta.get_field('slug').max_length
+        slug_bases = []
+        for title in titles:
+            slug_base = slugify(title)[:max_length]
+            if not slug_base:
+                # title might be empty
+                slug_base = "".join([random.choice("abcdef0123456789")
+                    for _ in range(7)])
+            slug_bases += [slug_base]
+
+        # Slugs with a suffix start with the slug base followed by '-',
+        # or with the slug base truncated to leave room for the suffix.
+        stem_length = max_length - self.MAX_SLUG_SUFFIX_LENGTH
+        taken = set(taken) if taken else set([])
+        distinct_bases = list(set(slug_bases))
+        for idx in range(0, len(distinct_bases), self.SLUG_BATCH_SIZE):
+            batch = distinct_bases[idx:idx + self.SLUG_BATCH_SIZE]
+            slugs_q = Q(slug__in=batch)
+            for stem in set([slug_base + '-' if len(slug_base) < stem_length
+                    else slug_base[:stem_length] for slug_base in batch]):
+                slugs_q |= Q(slug__startswith=stem)
+            taken |= set(self.filter(slugs_q).values_list('slug', flat=True))
+
+        slugs = []
+        next_suffixes = {}
+        for slug_base in slug_bases:
+            slug = slug_base
+            suffix_idx = next_suffixes.get(slug_base, 2)
+            while slug in taken:
+                suffix = '-%d' % suffix_idx
+                slug = slug_base[:(max_length - len(suffix))] + suffix
+                suffix_idx += 1
+            next_suffixes[slug_base] = suffix_idx
+            taken |= set([slug])
+            slugs += [slug]
+        return slugs
 
     @staticmethod
     def followed_by(user):
         return PageElement.objects.filter(followers__user=user)
 
+    @staticmethod
+    def annotate_reactions(elements, user=None):
+        """
+        Decorates *elements* with `vote`, `follow`, `last_read_at`
+        and `nb_comments_since_last_read` for *user*.
+
+        Attributes already set on an element (ex: through a queryset
+        `annotate`) are kept as is. The number of queries does not depend
+        on the number of *elements*.
+        """
+        elements = [element for element in elements
+            if isinstance(element, PageElement)]
+        saved = [element for element in elements if element.pk]
+        for element in elements:
+            if not element.pk:
+                for attr_name, default in (('vote', 0), ('follow', 0),
+                        ('last_read_at', None),
+                        ('nb_comments_since_last_read', 0)):
+                    if not hasattr(element, attr_name):
+                        setattr(element, attr_name, default)
+
+        if user is None:
+            return elements
+
+        missing = [element.pk for element in saved
+            if not hasattr(element, 'vote')]
+        if missing:
+            votes = dict(Vote.objects.filter(
+                user=user, element_id__in=missing).values_list(
+                'element_id', 'vote'))
+            for element in saved:
+                if element.pk in missing:
+                    vote = votes.get(element.pk)
+                    element.vote = (
+                        vote == Vote.UP_VOTE if vote is not None else None)
+
+        missing = [element.pk for element in saved
+            if not (hasattr(element, 'follow')
+                and hasattr(element, 'last_read_at'))]
+        if missing:
+            follows = dict(Follow.objects.filter(
+                user=user, element_id__in=missing).values_list(
+                'element_id', 'last_read_at'))
+            for element in saved:
+                if element.pk in missing:
+                    if not hasattr(element, 'follow'):
+                        element.follow = element.pk in follows
+                    if not hasattr(element, 'last_read_at'):
+                        element.last_read_at = follows.get(element.pk)
+
+        # Comments only count when the text was updated since
+        # the last time *user* read the element.
+        missing = [element.pk for element in saved
+            if not hasattr(element, 'nb_comments_since_last_read') and (
+                not element.last_read_at or (
+                element.text_updated_at
+                and element.text_updated_at > element.last_read_at))]
+        counts = {}
+        if missing:
+            counts = dict(Comment.objects.filter(
+                user=user, element_id__in=missing).values_list(
+                'element_id').annotate(Count('pk')).order_by())
+        for element in saved:
+            if not hasattr(element, 'nb_comments_since_last_read'):
+                element.nb_comments_since_last_read = counts.get(
+                    element.pk, 0)
+
+        return elements
+
 
 @python_2_unicode_compatible
 class PageElement(models.Model):
@@ -214,6 +819,11 @@ class PageElement(models.Model):
         ('MD', 'Markdown'),
     )
 
+    # Fields updated in the database directly, as votes, follows
+    # and edges are added or removed, hence never written by `save`
+    # once the page element exists.
+    DENORMALIZED_FIELDS = ('nb_upvotes', 'nb_followers', 'is_root', 'is_leaf')
+
     slug = models.SlugField(unique=True,
         help_text=_("Unique identifier that can be used in URL paths"))
     title = models.CharField(max_length=1024, blank=True,
@@ -236,6 +846,14 @@ class PageElement(models.Model):
     text_updated_at = models.DateTimeField(auto_now_add=True,
         help_text=_("Last updated at date for the text field"))
     extra = get_extra_field_class()(null=True, blank=True)
+    nb_upvotes = models.PositiveIntegerField(default=0,
+        help_text=_("Number of times the content has been upvoted"))
+    nb_followers = models.PositiveIntegerField(default=0,
+        help_text=_("Number of followers notified when content is updated"))
+    is_root = models.BooleanField(default=True, db_index=True,
+        help_text=_("No edge in the content DAG leads to the page element"))
+    is_leaf = models.BooleanField(default=True, db_index=True,
+        help_text=_("No edge in the content DAG starts from the page element"))
     relationships = models.ManyToManyField("self",
         related_name='related_to', through='RelationShip', symmetrical=False)
 
@@ -252,27 +870,30 @@ class PageElement(models.Model):
     @property
     def html_formatted(self):
         #pylint:disable=attribute-defined-outside-init
-        if not hasattr(self, '_html_formatted'):
+        key = (self.content_format, self.text)
+        if getattr(self, '_html_formatted_key', None) != key:
             self._html_formatted = self.get_html_formatted()
+            self._html_formatted_key = key
         return self._html_formatted
 
     @property
-    def nb_upvotes(self):
-        if not self.pk:
-            return 0
-        return Vote.objects.filter(element=self, vote=Vote.UP_VOTE).count()
-
-    @property
-    def nb_followers(self):
-        if not self.pk:
-            return 0
-        return Follow.objects.filter(element=self).count()
+    def extra_data(self):
+        """
+        `extra` field decoded from stringified JSON. The decoded value
+        is cached until another value is assigned to `extra`.
+        """
+        #pylint:disable=attribute-defined-outside-init
+        extra = self.extra
+        if (not hasattr(self, '_extra_data')
+            or self._extra_data_key is not extra):
+            self._extra_data = loads_extra(extra)
+            self._extra_data_key = extra
+        return self._extra_data
 
     def add_relationship(self, element, tag=None):
         rank = RelationShip.objects.filter(
             orig_element=self).aggregate(Max('rank')).get('rank__max', None)
-        if rank is None:
-            rank = 0
+        rank = 0 if rank is None else rank + RelationShip.RANK_GAP
         return RelationShip.objects.get_or_create(
             orig_element=self, dest_element=element,
             defaults={'tag': tag, 'rank': rank})
@@ -283,90 +904,105 @@ class PageElement(models.Model):
             dest_element=element).delete()
         return True
 
-    def get_descr(self):
-        #pylint:disable=too-many-nested-blocks
-        soup = BeautifulSoup(self.html_formatted, 'html5lib')
-        descr = soup.find('p')
-        if descr:
-            nb_available_characters = 5 * 60 # 5 lines of 60 characters
-            short_descr = soup.new_tag(name='p')
-            for child in descr.children:
-                if child.name:
-                    nb_available_characters -= len(child.text)
-                    short_descr.append(child)
-                else:
-                    child_text = child.text
-                    child_text_len = len(child_text)
-                    if nb_available_characters < child_text_len:
-                        for idx in range(nb_available_characters - 1, 0, -1):
-                            if child.text[idx] == " ":
-                                break
-                            nb_available_characters -= 1
-                        child_text = child.text[:nb_available_characters]
-                        nb_available_characters -= nb_available_characters
-                    else:
-                        nb_available_characters -= child_text_len
-                    short_descr.append(child_text)
-                if nb_available_characters < 0:
-                    break
+    def add_tags(self, tags):
+        """
+        Adds *tags* to the list of tags in the `extra` field, if they are
+        not already present, and saves the element.
+        """
+        extra = _load_extra(self.extra)
+        curr_tags = extra.get('tags', [])
+        if not isinstance(curr_tags, list):
+            curr_tags = [curr_tags]
+        for tag in tags:
+            if tag not in curr_tags:
+                curr_tags += [tag]
+        extra.update({'tags': curr_tags})
+        self.extra = _dump_extra(extra, self.extra)
+        self.save()
+
+    def remove_tags(self, tags):
+        """
+        Removes *tags* from the list of tags in the `extra` field
+        and saves the element.
+        """
+        extra = _load_extra(self.extra)
+        curr_tags = extra.get('tags', [])
+        if not isinstance(curr_tags, list):
+            curr_tags = [curr_tags]
+        curr_tags = [tag for tag in curr_tags if tag not in tags]
+        if curr_tags:
+            extra.update({'tags': curr_tags})
+        else:
+            extra.pop('tags', None)
+        self.extra = _dump_extra(extra, self.extra)
+        self.save()
 
-            # `string=` requires BeautifulSoup4>=4.13
-            tag = soup.new_tag(name='a',
-                href=reverse('pages_element', args=(self.slug,)))
-            tag.append("... read more")
-            short_descr.append(tag)
-            return str(short_descr)
-        return ""
+    def get_descr(self):
+        return get_descr(self.html_formatted, self.slug)
 
     def get_html_formatted(self):
         content_format = self.content_format
         text = self.text
         if content_format and content_format == 'HTML':
             return text
-        return markdown.markdown(text, extensions=['tables'])
+        return render_markdown(text)
 
 
-    def get_parent_paths(self, depth=None, hints=None):
+    def get_parent_paths(self, depth=None, hints=None, limit=None,
+                         parent_index=None, elements=None):
         """
         Returns a list of paths.
 
         When *depth* is specified each paths will be *depth* long or shorter.
         When *hints* is specified, it is a list of elements in a path. The
         paths returns will contain *hints* along the way.
+        When *limit* is specified, at most *limit* paths are returned.
         """
-        #pylint:disable=too-many-nested-blocks
-        if depth is not None and depth == 0:
-            return [[self]]
-        results = []
-        parents = [] if not self.pk else PageElement.objects.filter(
-            pk__in=RelationShip.objects.filter(dest_element=self).values(
-            'orig_element_id'))
-        if not parents:
-            return [[self]]
+        return list(itertools.islice(self.iter_parent_paths(
+            depth=depth, hints=hints, parent_index=parent_index,
+            elements=elements), limit))
+
+    def iter_parent_paths(self, depth=None, hints=None, parent_index=None,
+                          elements=None):
+        """
+        Generates the paths returned by ``get_parent_paths`` one at a time.
+
+        The paths are walked through *parent_index* (as returned by
+        ``RelationShip.objects.get_parent_index``, by default restricted
+        to the ancestors of the page element) such that retrieving
+        the first path only costs O(depth).
+
+        *elements* are ``PageElement`` already loaded from the database.
+        They are used to resolve *hints* and nodes on the paths without
+        further queries.
+        """
+        if not self.pk:
+            yield [self]
+            return
+        if parent_index is None:
+            parent_index = RelationShip.objects.get_parent_index(
+                pks=[self.pk])
+        elements_by_pk = {self.pk: self}
+        pks_by_slug = {self.slug: self.pk}
+        for element in (elements if elements else []):
+            elements_by_pk[element.pk] = element
+            pks_by_slug[element.slug] = element.pk
+        hint_pks = []
         if hints:
-            for parent in parents:
-                if parent.slug == str(hints[-1]):
-                    # we found a way to cut the search space early.
-                    parents = [parent]
-                    hints = hints[:-1]
-                    break
-        for parent in parents:
-            grandparents = parent.get_parent_paths(
-                depth=(depth - 1) if depth is not None else None,
-                hints=hints)
-            if grandparents:
-                for grandparent in grandparents:
-                    term_index = 0
-                    if hints:
-                        for node in grandparent:
-                            if node.slug == str(hints[term_index]):
-                                term_index += 1
-                                if term_index >= len(hints):
-                                    break
-                    if not hints or term_index >= len(hints):
-                        # we have not hints or we consumed all of them.
-                        results += [grandparent + [self]]
-        return results
+            hints = [str(hint) for hint in hints]
+            missing_slugs = [hint for hint in hints if hint not in pks_by_slug]
+            if missing_slugs:
+                pks_by_slug.update(dict(PageElement.objects.filter(
+                    slug__in=missing_slugs).values_list('slug', 'pk')))
+            hint_pks = [pks_by_slug.get(hint) for hint in hints]
+        for path in _iter_parent_paths(self.pk, parent_index,
+                depth=depth, hint_pks=hint_pks):
+            missing_pks = [pk for pk in path if pk not in elements_by_pk]
+            if missing_pks:
+                elements_by_pk.update({element.pk: element
+                    for element in PageElement.objects.filter(
+                        pk__in=missing_pks)})
+            yield [elements_by_pk[pk] for pk in path]
 
     def get_relationships(self, tag=None):
         if not tag:
@@ -388,38 +1024,147 @@ class PageElement(models.Model):
              using=None, update_fields=None):
         if self.__original_text != self.text:
             self.text_updated_at = datetime_or_now()
+        if not self.pk:
+            # No edge can start from or lead to a new page element yet.
+            self.is_root = True
+            self.is_leaf = True
+        elif (update_fields is None and not force_insert and
+              not self._state.adding):
+            # The denormalized fields are updated in the database directly
+            # and might be stale on this instance.
+            update_fields = [field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in self.DENORMALIZED_FIELDS]
 
         if self.slug: # serializer will set created slug to '' instead of None.
             return super(PageElement, self).save(
                 force_insert=force_insert, force_update=force_update,
                 using=using, update_fields=update_fields)
-        max_length = self._meta.get_field('slug').max_length
-        slug_base = slugify(self.title)
-        if not slug_base:
-            # title might be empty
-            "".join([random.choice("abcdef0123456789") for _ in range(7)])
-        elif len(slug_base) > max_length:
-            slug_base = slug_base[:max_length]
-        self.slug = slug_base
-        for _ in range(1, 10):
+        taken = set([])
+        for _attempt in range(3):
+            self.slug = PageElement.objects.get_unique_slugs(
+                [self.title], taken=taken)[0]
             try:
                 with transaction.atomic():
                     return super(PageElement, self).save(
                         force_insert=force_insert, force_update=force_update,
                         using=using, update_fields=update_fields)
             except IntegrityError as err:
+                # Another page element with the same slug might have been
+                # created concurrently.
                 if 'uniq' not in str(err).lower():
                     raise
-                suffix = '-%s' % "".join([random.choice("abcdef0123456789")
-                    for _ in range(7)])
-                if len(slug_base) + len(suffix) > max_length:
-                    self.slug = slug_base[:(max_length - len(suffix))] + suffix
-                else:
-                    self.slug = slug_base + suffix
+                taken |= set([self.slug])
         raise ValidationError({'detail':
             "Unable to create a unique URL slug from title '%s'" % self.title})
 
 
+class ElementTagManager(models.Manager):
+
+    @staticmethod
+    def get_tags(extra):
+        """
+        Returns the set of (field, tag) found in *extra*.
+
+        Each string listed under a key of *extra* is a tag for that key.
+        A string value is a tag by itself. Other values that evaluate
+        to `True` (ex: `"pagebreak": true`) are recorded with an empty tag.
+        """
+        tags = set()
+        max_length = ElementTag._meta.get_field('tag').max_length
+        for field, value in six.iteritems(_load_extra(extra)):
+            field = field[:max_length]
+            field_tags = set()
+            if isinstance(value, list):
+                field_tags = set([(field, item[:max_length])
+                    for item in value if isinstance(item, six.string_types)])
+            elif isinstance(value, six.string_types):
+                if value:
+                    field_tags = set([(field, value[:max_length])])
+            if value and not field_tags:
+                field_tags = set([(field, "")])
+            tags |= field_tags
+        return tags
+
+    def sync(self, element):
+        """
+        Updates the tags of *element* to match its `extra` field.
+        """
+        tags = self.get_tags(element.extra)
+        curr_tags = {(field, tag): pk for pk, field, tag in self.filter(
+            element=element).values_list('pk', 'field', 'tag')}
+        to_delete = [pk for key, pk in six.iteritems(curr_tags)
+            if key not in tags]
+        if to_delete:
+            self.filter(pk__in=to_delete).delete()
+        to_create = [self.model(element=element, field=field, tag=tag)
+            for field, tag in tags if (field, tag) not in curr_tags]
+        if to_create:
+            self.bulk_create(to_create)
+
+    def create_tags(self, elements):
+        """
+        Records the tags of *elements*, which do not have any recorded yet
+        (ex: created through ``bulk_create``).
+        """
+        self.bulk_create([self.model(element=element, field=field, tag=tag)
+            for element in elements
+            for field, tag in self.get_tags(element.extra)])
+
+    def rebuild(self, batch_size=1000):
+        """
+        Recomputes the tags of all ``PageElement`` from their `extra` field.
+        """
+        with transaction.atomic():
+            self.all().delete()
+            to_create = []
+            for element_id, extra in PageElement.objects.values_list(
+                    'pk', 'extra').order_by('pk').iterator():
+                to_create += [self.model(element_id=element_id,
+                    field=field, tag=tag)
+                    for field, tag in self.get_tags(extra)]
+                if len(to_create) >= batch_size:
+                    self.bulk_create(to_create)
+                    to_create = []
+            if to_create:
+                self.bulk_create(to_create)
+
+
+@python_2_unicode_compatible
+class ElementTag(models.Model):
+    """
+    Tags of a ``PageElement``, as found in its `extra` field, such that
+    elements can be filtered with index lookups.
+
+    *field* is the key in `extra` (ex: 'visibility', 'tags') and *tag*
+    one of the values listed under that key.
+    """
+    objects = ElementTagManager()
+
+    # Keys in `extra` whose tags make an element visible.
+    VISIBILITY_FIELDS = ('visibility', 'tags')
+
+    element = models.ForeignKey(PageElement, on_delete=models.CASCADE,
+        related_name='element_tags')
+    field = models.CharField(max_length=255,
+        help_text=_("Key in the extra field the tag is listed under"))
+    tag = models.CharField(max_length=255, blank=True,
+        help_text=_("Tag"))
+
+    class Meta:
+        unique_together = ('element', 'field', 'tag')
+        indexes = [models.Index(fields=['field', 'tag'])]
+
+    def __str__(self):
+        return "%s:%s=%s" % (self.element_id, self.field, self.tag)
+
+
+@receiver(post_save, sender=PageElement)
+def element_tags_on_save(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    ElementTag.objects.sync(instance)
+
+
 @python_2_unicode_compatible
 class Comment(models.Model):
     """
@@ -455,15 +1200,14 @@ class FollowManager(models.Manager):
         Subscribe a User to changes to a Element.
         """
         self.get_or_create(user=user, element=element)
+        element.refresh_from_db(fields=['nb_followers'])
 
     def unsubscribe(self, element, user):
         """
         Unsubscribe a User from changes to a Element.
         """
-        try:
-            self.get(user=user, element=element).delete()
-        except models.ObjectDoesNotExist:
-            pass
+        self.filter(user=user, element=element).delete()
+        element.refresh_from_db(fields=['nb_followers'])
 
 
 @python_2_unicode_compatible
@@ -584,26 +1328,316 @@ class SequenceProgress(models.Model):
 
     @property
     def is_completed(self):
-        if self.sequence.has_certificate:
-            # We exclude the element with the highest rank
-            certificate_element = self.sequence.get_certificate
-            enumerated_elements = EnumeratedElements.objects.filter(
-                sequence=self.sequence).exclude(
-                content__slug=certificate_element.slug)
-        else:
-            enumerated_elements = EnumeratedElements.objects.filter(
-                sequence=self.sequence).order_by('rank')
-        user_enumerated_progress = EnumeratedProgress.objects.filter(
-            progress=self,
-            rank__in=enumerated_elements.values_list(
-            'rank', flat=True))
-        for element in enumerated_elements:
-            if not user_enumerated_progress.filter(
-                    rank=element.rank,
-                    viewing_duration__gte=element.min_viewing_duration
-            ).exists():
-                return False
-        return True
+        """
+        Returns `True` when the user viewed each element of the sequence,
+        except the certificate, for at least its `min_viewing_duration`.
+
+        The first time the sequence is found completed, `completion_date`
+        is recorded, and later calls return `True` without a query.
+        """
+        #pylint:disable=attribute-defined-outside-init
+        if self.completion_date:
+            return True
+        if not hasattr(self, '_is_completed'):
+            steps = EnumeratedElements.objects.filter(
+                sequence_id=self.sequence_id)
+            if self.sequence.has_certificate:
+                # We exclude the element with the highest rank
+                steps = steps.exclude(pk=models.Subquery(
+                    EnumeratedElements.objects.filter(
+                    sequence_id=self.sequence_id).order_by(
+                    '-rank').values('pk')[:1]))
+            counts = steps.annotate(progress=models.FilteredRelation(
+                'enumeratedprogress',
+                condition=Q(enumeratedprogress__sequence_progress=self))
+            ).aggregate(nb_steps=Count('pk'), nb_completed=Count('pk',
+                filter=Q(progress__viewing_duration__gte=models.F(
+                    'min_viewing_duration'))))
+            self._is_completed = (
+                counts['nb_completed'] == counts['nb_steps'])
+            if self._is_completed and self.pk:
+                self.completion_date = datetime_or_now()
+                self.save(update_fields=['completion_date'])
+        return self._is_completed
+
+
+class EnumeratedProgressManager(models.Manager):
+
+    @staticmethod
+    def get_buffered(key):
+        """
+        Returns the `EnumeratedProgress` a ping identified by *key* was
+        last recorded against when pings are buffered, or `None`.
+        """
+        with _PING_BUFFER['lock']:
+            return _PING_BUFFER['progress_by_key'].get(key)
+
+    def record_ping(self, progress, key=None, at_time=None):
+        """
+        Adds the time elapsed since the last ping to the viewing duration
+        of *progress*, with a cap for inactivity.
+
+        When `PING_FLUSH_INTERVAL` is set, the ping is recorded without
+        writing to the database. The increment and the last ping time are
+        kept in an in-process buffer, and the last ping time is also stored
+        in the default Django cache, so all processes sharing that cache
+        compute increments from the same value. Buffered pings are written
+        to the database in bulk every `PING_FLUSH_INTERVAL` seconds,
+        and when the process exits. *progress* is also remembered under
+        *key* so the next ping with the same *key* is recorded without
+        a `SELECT`.
+        """
+        at_time = datetime_or_now(at_time)
+        if not settings.PING_FLUSH_INTERVAL:
+            progress.viewing_duration += self._get_ping_increment(
+                progress, at_time)
+            progress.last_ping_time = at_time
+            progress.save()
+            return progress
+
+        cache = caches['default']
+        cache_key = PING_TIME_KEY % progress.pk
+        last_ping_time = cache.get(cache_key)
+        with _PING_BUFFER['lock']:
+            if (last_ping_time is not None and (
+                    progress.last_ping_time is None or
+                    last_ping_time > progress.last_ping_time)):
+                # Another process recorded a more recent ping.
+                progress.last_ping_time = last_ping_time
+            if (progress.last_ping_time is not None and
+                progress.last_ping_time >= at_time):
+                # A more recent ping was already recorded.
+                time_increment = datetime.timedelta()
+            else:
+                time_increment = self._get_ping_increment(progress, at_time)
+                progress.last_ping_time = at_time
+            progress.viewing_duration += time_increment
+            pending = _PING_BUFFER['pending']
+            if progress.pk in pending:
+                time_increment += pending[progress.pk][1]
+            pending[progress.pk] = (progress, time_increment)
+            if key is not None:
+                _PING_BUFFER['progress_by_key'][key] = progress
+            flush_due = (time.monotonic() - _PING_BUFFER['flushed_at']
+                >= settings.PING_FLUSH_INTERVAL)
+            flusher = _PING_BUFFER['flusher']
+            if flusher is None or not flusher.is_alive():
+                # Threads do not survive a fork, so we also check
+                # the flusher is still running.
+                flusher = threading.Thread(target=_flush_pings_periodically,
+                    name='pages-ping-flusher', daemon=True)
+                _PING_BUFFER['flusher'] = flusher
+                flusher.start()
+        # Once the entry expires, the last ping is older than the cap
+        # for inactivity, so the increment does not depend on it anymore.
+        cache.set(cache_key, progress.last_ping_time,
+            timeout=settings.PING_INTERVAL + 1)
+        if flush_due:
+            self.flush_pings()
+        return progress
+
+    def flush_pings(self):
+        """
+        Writes the buffered viewing duration increments and last ping
+        times to the database and refreshes the buffered
+        `EnumeratedProgress` with the values written by other processes.
+
+        `EnumeratedProgress` that have not been pinged since the previous
+        flush, or that were deleted, are evicted from the buffer.
+        """
+        with _PING_BUFFER['lock']:
+            pending = _PING_BUFFER['pending']
+            _PING_BUFFER['pending'] = {}
+            _PING_BUFFER['flushed_at'] = time.monotonic()
+            progress_by_key = _PING_BUFFER['progress_by_key']
+            for key, progress in list(six.iteritems(progress_by_key)):
+                if progress.pk not in pending:
+                    del progress_by_key[key]
+            updates = []
+            for progress_pk, (progress, time_increment) in six.iteritems(
+                    pending):
+                # Another process might have written a more recent ping.
+                last_ping_time = models.Value(progress.last_ping_time,
+                    output_field=models.DateTimeField())
+                updates += [self.model(pk=progress_pk,
+                    viewing_duration=(
+                        models.F('viewing_duration') + time_increment),
+                    last_ping_time=Greatest(Coalesce(
+                        'last_ping_time', last_ping_time), last_ping_time))]
+        if not pending:
+            return
+        self.bulk_update(updates, ['viewing_duration', 'last_ping_time'])
+        progress_values = {progress_pk: (viewing_duration, last_ping_time)
+            for progress_pk, viewing_duration, last_ping_time
+            in self.filter(pk__in=pending).values_list(
+                'pk', 'viewing_duration', 'last_ping_time')}
+        with _PING_BUFFER['lock']:
+            progress_by_key = _PING_BUFFER['progress_by_key']
+            for key, progress in list(six.iteritems(progress_by_key)):
+                if progress.pk not in pending:
+                    continue
+                if progress.pk not in progress_values:
+                    # The progress was deleted (ex: reset) in the meantime.
+                    del progress_by_key[key]
+                    continue
+                # Increments buffered while we were flushing are not
+                # in the database yet.
+                progress.viewing_duration, last_ping_time = progress_values[
+                    progress.pk]
+                if (last_ping_time is not None and (
+                        progress.last_ping_time is None or
+                        last_ping_time > progress.last_ping_time)):
+                    progress.last_ping_time = last_ping_time
+                if progress.pk in _PING_BUFFER['pending']:
+                    progress.viewing_duration += \
+                        _PING_BUFFER['pending'][progress.pk][1]
+
+    def record_pings(self, pings, account, at_time=None):
+        """
+        Adds the *elapsed* time of each ping in *pings*, a list of
+        dictionaries with *user* (username), *sequence* (slug), *rank*
+        and *elapsed* keys, to the viewing duration of the corresponding
+        `EnumeratedProgress`, creating the progress records as necessary.
+        Unlike `record_ping`, the *elapsed* time is trusted as submitted.
+
+        Only sequences provided by *account* can be pinged. All pings
+        are recorded in a single transaction with a constant number
+        of queries. If any user, sequence or rank cannot be found,
+        or a sequence is not provided by *account*, none of the pings
+        are recorded.
+
+        Returns the list of pings with the updated *viewing_duration*.
+        """
+        #pylint:disable=too-many-locals
+        at_time = datetime_or_now(at_time)
+        if not pings:
+            return []
+        users = {user.username: user
+            for user in get_user_model().objects.filter(
+                username__in=set(ping['user'] for ping in pings))}
+        steps = {(step.sequence.slug, step.rank): step
+            for step in EnumeratedElements.objects.filter(
+                sequence__slug__in=set(ping['sequence'] for ping in pings),
+                rank__in=set(ping['rank'] for ping in pings)).select_related(
+                'sequence')}
+        errors = []
+        for ping in pings:
+            if ping['user'] not in users:
+                errors += [_("user %(user)s does not exist.") % ping]
+            step = steps.get((ping['sequence'], ping['rank']))
+            if step is None:
+                errors += [_("%(sequence)s has no element at rank"\
+                    " %(rank)s.") % ping]
+            elif step.sequence.account_id != account.pk:
+                errors += [_("%(sequence)s is not provided by"\
+                    " %(account)s.") % {
+                    'sequence': ping['sequence'], 'account': account}]
+        if errors:
+            raise ValidationError(errors)
+
+        # Adds up the pings for the same user and element.
+        elapsed_by_keys = OrderedDict()
+        for ping in pings:
+            key = (ping['user'], ping['sequence'], ping['rank'])
+            elapsed_by_keys[key] = elapsed_by_keys.get(
+                key, datetime.timedelta()) + ping['elapsed']
+
+        with transaction.atomic():
+            # Creates the missing `SequenceProgress` and `EnumeratedProgress`
+            user_ids = set(users[key[0]].pk for key in elapsed_by_keys)
+            sequence_ids = set(steps[key[1:]].sequence_id
+                for key in elapsed_by_keys)
+            sequence_progresses = {}
+            for _attempt in range(2):
+                for sequence_progress in SequenceProgress.objects.filter(
+                        user_id__in=user_ids,
+                        sequence_id__in=sequence_ids).order_by('-pk'):
+                    sequence_progresses[(sequence_progress.user_id,
+                        sequence_progress.sequence_id)] = sequence_progress
+                missing = set((users[key[0]].pk, steps[key[1:]].sequence_id)
+                    for key in elapsed_by_keys) - set(sequence_progresses)
+                if not missing:
+                    break
+                SequenceProgress.objects.bulk_create([
+                    SequenceProgress(user_id=user_id, sequence_id=sequence_id)
+                    for user_id, sequence_id in missing])
+            progresses = {}
+            for _attempt in range(2):
+                for progress in self.filter(
+                        sequence_progress__in=[sequence_progress.pk
+                        for sequence_progress in sequence_progresses.values()],
+                        step__in=[step.pk for step in steps.values()]):
+                    progresses[(progress.sequence_progress_id,
+                        progress.step_id)] = progress
+                missing = set((sequence_progresses[(users[key[0]].pk,
+                    steps[key[1:]].sequence_id)].pk, steps[key[1:]].pk)
+                    for key in elapsed_by_keys) - set(progresses)
+                if not missing:
+                    break
+                self.bulk_create([self.model(
+                    sequence_progress_id=sequence_progress_id,
+                    step_id=step_id)
+                    for sequence_progress_id, step_id in missing])
+
+            progress_by_keys = OrderedDict()
+            for key, elapsed in six.iteritems(elapsed_by_keys):
+                step = steps[key[1:]]
+                progress = progresses[(sequence_progresses[(
+                    users[key[0]].pk, step.sequence_id)].pk, step.pk)]
+                progress_by_keys[key] = progress
+                progress.viewing_duration = (
+                    models.F('viewing_duration') + elapsed)
+                progress.last_ping_time = at_time
+            self.bulk_update(list(progress_by_keys.values()),
+                ['viewing_duration', 'last_ping_time'])
+            viewing_durations = dict(self.filter(
+                pk__in=[progress.pk for progress in progress_by_keys.values()]
+                ).values_list('pk', 'viewing_duration'))
+
+        results = []
+        for ping in pings:
+            progress = progress_by_keys[
+                (ping['user'], ping['sequence'], ping['rank'])]
+            progress.viewing_duration = viewing_durations[progress.pk]
+            result = dict(ping)
+            result.update({'viewing_duration': progress.viewing_duration})
+            results += [result]
+        return results
+
+    @staticmethod
+    def _get_ping_increment(progress, at_time):
+        if progress.last_ping_time:
+            # Add only the actual time elapsed, with a cap for inactivity
+            return min(at_time - progress.last_ping_time,
+                datetime.timedelta(seconds=settings.PING_INTERVAL + 1))
+        # Set the initial increment to the expected ping interval
+        # (i.e., 10 seconds)
+        return datetime.timedelta(seconds=settings.PING_INTERVAL)
+
+
+def _flush_pings_periodically():
+    while True:
+        time.sleep(settings.PING_FLUSH_INTERVAL)
+        if not _PING_BUFFER['pending']:
+            continue
+        try:
+            EnumeratedProgress.objects.flush_pings()
+        except Exception as err: #pylint:disable=broad-except
+            LOGGER.error("error flushing %d progress pings: %s",
+                len(_PING_BUFFER['pending']), err)
+        finally:
+            # Django opened a database connection for this thread.
+            connection.close()
+
+
+@atexit.register
+def _flush_pings_at_exit():
+    if _PING_BUFFER['pending']:
+        try:
+            EnumeratedProgress.objects.flush_pings()
+        except Exception as err: #pylint:disable=broad-except
+            LOGGER.error("error flushing %d progress pings: %s",
+                len(_PING_BUFFER['pending']), err)
 
 
 @python_2_unicode_compatible
@@ -611,6 +1645,8 @@ class EnumeratedProgress(models.Model):
     """
     Progress of a `User` on each element of a sequence.
     """
+    objects = EnumeratedProgressManager()
+
     created_at = models.DateTimeField(editable=False, auto_now_add=True)
     sequence_progress = models.ForeignKey(
         SequenceProgress, on_delete=models.CASCADE)
@@ -656,21 +1692,26 @@ class VoteManager(models.Manager):
         """
         Vote a Element up by a User.
         """
-        vote, created = self.get_or_create(user=user, element=element,
-            defaults={'vote': Vote.UP_VOTE})
-        if not created:
-            vote.vote = Vote.UP_VOTE
-            vote.save()
+        with transaction.atomic():
+            vote, created = self.select_for_update().get_or_create(
+                user=user, element=element, defaults={'vote': Vote.UP_VOTE})
+            if not created and vote.vote != Vote.UP_VOTE:
+                vote.vote = Vote.UP_VOTE
+                vote.save()
+        element.refresh_from_db(fields=['nb_upvotes'])
 
     def vote_down(self, element, user):
         """
         Vote a Element down by a User.
         """
-        vote, created = self.get_or_create(user=user, element=element,
-            defaults={'vote': Vote.DOWN_VOTE})
-        if not created:
-            vote.vote = Vote.DOWN_VOTE
-            vote.save()
+        with transaction.atomic():
+            vote, created = self.select_for_update().get_or_create(
+                user=user, element=element,
+                defaults={'vote': Vote.DOWN_VOTE})
+            if not created and vote.vote != Vote.DOWN_VOTE:
+                vote.vote = Vote.DOWN_VOTE
+                vote.save()
+        element.refresh_from_db(fields=['nb_upvotes'])
 
 
 @python_2_unicode_compatible
@@ -697,6 +1738,12 @@ class Vote(models.Model):
         # One vote per user per Element
         unique_together = (('user', 'element'),)
 
+    def __init__(self, *args, **kwargs):
+        super(Vote, self).__init__(*args, **kwargs)
+        # Keeps track of the vote as it was loaded from the database
+        # such that changes can be reflected in `PageElement.nb_upvotes`.
+        self._original_vote = self.vote
+
     def __str__(self):
         return "%s: %s on %s" % (self.user, self.vote, self.element)
 
@@ -707,32 +1754,363 @@ class Vote(models.Model):
         return self.vote == self.DOWN_VOTE
 
 
+def update_reaction_counts(element_id, **increments):
+    """
+    Atomically adds *increments* (ex: `nb_upvotes=1`) to the denormalized
+    reaction counters of the `PageElement` identified by *element_id*.
+
+    Counters never go below zero, in case they were not initialized
+    (see the ``recompute_reaction_counts`` command).
+    """
+    PageElement.objects.filter(pk=element_id).update(**{
+        field_name: Greatest(models.F(field_name) + increment, 0)
+        for field_name, increment in six.iteritems(increments)})
+
+
+@receiver(post_save, sender=Vote)
+def reaction_counts_on_vote_save(sender, instance, created, **kwargs):
+    #pylint:disable=unused-argument,protected-access
+    was_upvote = (not created and instance._original_vote == Vote.UP_VOTE)
+    if instance.is_upvote() != was_upvote:
+        update_reaction_counts(instance.element_id,
+            nb_upvotes=1 if instance.is_upvote() else -1)
+    instance._original_vote = instance.vote
+
+
+@receiver(post_delete, sender=Vote)
+def reaction_counts_on_vote_delete(sender, instance, **kwargs):
+    #pylint:disable=unused-argument,protected-access
+    # Also called for each vote deleted in cascade with a user
+    # or an element.
+    if instance._original_vote == Vote.UP_VOTE:
+        update_reaction_counts(instance.element_id, nb_upvotes=-1)
+
+
+@receiver(post_save, sender=Follow)
+def reaction_counts_on_follow_save(sender, instance, created, **kwargs):
+    #pylint:disable=unused-argument
+    if created:
+        update_reaction_counts(instance.element_id, nb_followers=1)
+
+
+@receiver(post_delete, sender=Follow)
+def reaction_counts_on_follow_delete(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    update_reaction_counts(instance.element_id, nb_followers=-1)
+
+
+def _get_available_q(visibility=None, accounts=None, field_prefix=""):
+    """
+    Returns a filter on ``PageElement`` that are either visible
+    through one of *visibility* tags or owned by one of *accounts*.
+
+    *field_prefix* is used to access the ``PageElement`` fields through
+    a relation (ex: 'dest_element__').
+    """
+    filtered_in = None
+    if visibility:
+        filtered_in = Q(**{'%sid__in' % field_prefix:
+            ElementTag.objects.filter(
+                field__in=ElementTag.VISIBILITY_FIELDS,
+                tag__in=visibility).values('element_id')})
+    if accounts:
+        accounts_q = Q(**{'%saccount__slug__in' % field_prefix: accounts})
+        if filtered_in:
+            filtered_in |= accounts_q
+        else:
+            filtered_in = accounts_q
+    return filtered_in
+
+
+def _get_cut_q(cut, field_prefix=""):
+    """
+    Returns a filter on ``PageElement`` matching the nodes a content tree
+    is cut at, or `None` when *cut* cannot be evaluated by the database.
+
+    A ``ContentCut`` stops at nodes whose `extra` field has a key named
+    after the cut tag with a value that evaluates to `True`,
+    or lists the cut tag in `tags`. This is what the ``ElementTag``
+    table records.
+    """
+    if (cut is None or not cut.match or
+        type(cut).enter is not ContentCut.enter):
+        # We cannot know what `enter` does in a subclass.
+        return None
+    return Q(**{'%sid__in' % field_prefix: ElementTag.objects.filter(
+        Q(field=cut.match) | Q(field='tags', tag=cut.match)).values(
+        'element_id')})
+
+
+def _load_extra(extra):
+    """
+    Returns a copy of *extra* as a dictionnary, whether it is stored
+    as a dictionnary or as stringified JSON.
+    """
+    extra = loads_extra(extra)
+    return dict(extra) if isinstance(extra, dict) else {}
+
+
+def _dump_extra(extra, prev_extra=None):
+    """
+    Returns *extra* in the same format *prev_extra* was stored.
+    """
+    if isinstance(prev_extra, dict):
+        return extra
+    if (prev_extra is None and
+        not issubclass(get_extra_field_class(), models.TextField)):
+        return extra
+    return json.dumps(extra)
+
+
+class ContentTreeNode(object):
+    """
+    Node in a content tree, as returned by ``build_content_tree``.
+
+    Slugs are interned and the path of a node is not stored. It is
+    computed from the `base` path of its root and the slugs along the way
+    when the tree is flattened.
+
+    For backward compatibility, a node can also be used as a pair
+    (data, children) where `data` is a dict ready to be serialized
+    and `children` maps the path of each child to its node. `data` is
+    created on first access and stored in the node, such that changes
+    to it are kept when the tree is flattened. `children` is read-only.
+    """
+    __slots__ = ('slug', 'title', 'picture', 'extra', 'text',
+        'children', 'parent', 'base', '_data')
+
+    def __init__(self, slug, title, picture=None, extra=None, text=None,
+                 parent=None, base=None):
+        #pylint:disable=too-many-arguments
+        self.slug = sys.intern(slug) if type(slug) is str else slug
+        self.title = title
+        self.picture = picture
+        self.extra = extra
+        self.text = text
+        self.children = []
+        self.parent = parent
+        self.base = base
+        self._data = None
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        return iter((self.as_dict(), self.get_children_by_path()))
+
+    def __getitem__(self, index):
+        return (self.as_dict, self.get_children_by_path)[index]()
+
+    @property
+    def path(self):
+        slugs = []
+        node = self
+        while node.base is None:
+            slugs += [node.slug]
+            node = node.parent
+        return node.base + "".join(["/" + slug for slug in reversed(slugs)])
+
+    def as_dict(self):
+        if self._data is None:
+            self._data = {'slug': self.slug, 'title': self.title}
+            if self.picture:
+                self._data.update({'picture': self.picture})
+            if self.extra:
+                self._data.update({'extra': self.extra})
+            if self.text:
+                self._data.update({'text': self.text})
+        return self._data
+
+    def get_children_by_path(self):
+        path = self.path
+        return types.MappingProxyType(OrderedDict([
+            (path + "/" + child.slug, child) for child in self.children]))
+
+
+def _build_content_tree_node(slug, title, picture=None, extra=None,
+                             text=None, parsed_extras=None,
+                             parent=None, base=None):
+    """
+    Returns a node in the content tree, added to the children
+    of *parent* when specified.
+
+    *parsed_extras* maps `extra` fields, as stored in the database,
+    to their decoded value such that the same `extra` field is decoded
+    only once while building a content tree (ex: a node reachable through
+    many edges).
+    """
+    #pylint:disable=too-many-arguments
+    if parsed_extras is None:
+        extra = loads_extra(extra)
+    elif isinstance(extra, six.string_types):
+        parsed_extra = parsed_extras.get(extra)
+        if parsed_extra is None:
+            parsed_extra = loads_extra(extra)
+            parsed_extras[extra] = parsed_extra
+        extra = parsed_extra
+    result_node = ContentTreeNode(slug, title, picture=picture,
+        extra=extra, text=text, parent=parent, base=base)
+    if parent is not None:
+        parent.children += [result_node]
+    return result_node
+
+
+def _iter_parent_paths(pk, parent_index, depth=None, hint_pks=None):
+    """
+    Generates the paths, as lists of primary keys, from a root
+    of the content DAG to *pk*.
+    """
+    if depth is not None and depth == 0:
+        yield [pk]
+        return
+    parent_pks = parent_index.get(pk)
+    if not parent_pks:
+        yield [pk]
+        return
+    if hint_pks and hint_pks[-1] in parent_pks:
+        # we found a way to cut the search space early.
+        parent_pks = [hint_pks[-1]]
+        hint_pks = hint_pks[:-1]
+    for parent_pk in parent_pks:
+        for path in _iter_parent_paths(parent_pk, parent_index,
+                depth=(depth - 1) if depth is not None else None,
+                hint_pks=hint_pks):
+            term_index = 0
+            if hint_pks:
+                for node_pk in path:
+                    if node_pk == hint_pks[term_index]:
+                        term_index += 1
+                        if term_index >= len(hint_pks):
+                            break
+            if not hint_pks or term_index >= len(hint_pks):
+                # we have not hints or we consumed all of them.
+                yield path + [pk]
+
+
+def get_content_tree_cache():
+    """
+    Returns the cache content trees are stored in, or `None` when
+    the ``CONTENT_TREE_CACHE`` setting is not defined.
+    """
+    if not settings.CONTENT_TREE_CACHE:
+        return None
+    return caches[settings.CONTENT_TREE_CACHE]
+
+
+def get_content_tree_version(cache):
+    """
+    Returns the version counter content trees are currently cached under.
+    """
+    version = cache.get(CONTENT_TREE_VERSION_KEY)
+    if version is None:
+        # We start from a timestamp such that a counter that was evicted
+        # from the cache does not bring back stale content trees.
+        cache.add(CONTENT_TREE_VERSION_KEY, int(time.time() * 1000),
+            timeout=None)
+        version = cache.get(CONTENT_TREE_VERSION_KEY, 0)
+    return version
+
+
+def invalidate_content_tree():
+    """
+    Bumps the version counter such that cached content trees are rebuilt
+    once the current transaction commits.
+    """
+    cache = get_content_tree_cache()
+    if cache is None:
+        return
+
+    def bump_version():
+        try:
+            cache.incr(CONTENT_TREE_VERSION_KEY)
+        except ValueError:
+            # The version counter was evicted from the cache.
+            get_content_tree_version(cache)
+
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=PageElement)
+@receiver(post_delete, sender=PageElement)
+def content_tree_on_change(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    invalidate_content_tree()
+
+
+@receiver(post_save, sender=PageElement)
+def search_index_on_save(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    get_search_engine().index([instance])
+
+
+@receiver(post_delete, sender=PageElement)
+def search_index_on_delete(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    get_search_engine().remove([instance.pk])
+
+
 def build_content_tree(roots=None, prefix=None, cut=None,
                        visibility=None, accounts=None):
     """
     Returns a content tree from a list of roots.
 
+    When the ``CONTENT_TREE_CACHE`` setting is defined, the content tree
+    is stored in, and returned from, that cache until
+    ``invalidate_content_tree`` is called.
+    """
+    cache = get_content_tree_cache()
+    if cache is None:
+        return _build_content_tree(roots=roots, prefix=prefix, cut=cut,
+            visibility=visibility, accounts=accounts)
+
+    roots_key = None
+    if roots is not None:
+        roots_key = [root.pk if isinstance(root, PageElement)
+            else root.get('dest_element__pk') for root in roots]
+    cache_key = "%s:%s:%s" % (CONTENT_TREE_CACHE_KEY_PREFIX,
+        get_content_tree_version(cache),
+        hashlib.sha256(json.dumps([roots_key, prefix,
+            cut.get_cache_key() if cut is not None else None,
+            sorted(visibility) if visibility else None,
+            sorted(accounts) if accounts else None]).encode(
+            'utf-8')).hexdigest())
+    results = cache.get(cache_key)
+    if results is None:
+        results = _build_content_tree(roots=roots, prefix=prefix, cut=cut,
+            visibility=visibility, accounts=accounts)
+        cache.set(cache_key, results)
+    return results
+
+
+def _build_content_tree(roots=None, prefix=None, cut=None,
+                        visibility=None, accounts=None):
+    """
+    Returns a content tree from a list of roots.
+
     code::
 
         build_content_tree(roots=[PageElement<boxes-and-enclosures>])
         {
-          "/boxes-and-enclosures": [
-            { ... data for node ... },
-            {
-              "boxes-and-enclosures/management": [
-              { ... data for node ... },
-              {}],
-              "boxes-and-enclosures/design": [
-              { ... data for node ... },
-              {}],
-            }]
+          "/boxes-and-enclosures": ContentTreeNode(
+            slug="boxes-and-enclosures", ...,
+            children=[
+              ContentTreeNode(slug="management", ..., children=[]),
+              ContentTreeNode(slug="design", ..., children=[])
+            ])
         }
+
+    Each node can still be unpacked as a pair (data, children), i.e.
+    `{ ... data for node ... }` and a dictionnary of child nodes keyed
+    by their path (ex: "/boxes-and-enclosures/management").
+
+    The nodes below the roots are retrieved level by level, through
+    the ``RelationShipClosure`` table when the ``CONTENT_TREE_ENGINE``
+    setting is 'closure', or through a single recursive SQL query when
+    ``CONTENT_TREE_ENGINE`` is 'recursive' (SQLite and PostgreSQL only).
     """
-    #pylint:disable=too-many-locals,too-many-statements
+    #pylint:disable=too-many-locals
     # Implementation Note: The structure of the content in the database
     # is stored in terms of `PageElement` (node) and `Relationship` (edge).
-    # We use a breadth-first search algorithm here such as to minimize
-    # the number of queries to the database.
     LOGGER.debug("build_content_tree"\
         "(roots=%s, prefix=%s, cut=%s, visibility=%s, accounts=%s)",
         roots, prefix, cut, visibility, accounts)
@@ -754,33 +2132,17 @@ def build_content_tree(roots=None, prefix=None, cut=None,
     if not prefix.startswith("/"):
         prefix = '/%s' % prefix
     prefix = prefix.rstrip('/')
-    filtered_in = None
-    if visibility:
-        for visible in visibility:
-            visibility_q = Q(dest_element__extra__contains=visible)
-            if filtered_in:
-                filtered_in |= visibility_q
-            else:
-                filtered_in = visibility_q
-    if accounts:
-        accounts_q = Q(dest_element__account__slug__in=accounts)
-        if filtered_in:
-            filtered_in |= accounts_q
-        else:
-            filtered_in = accounts_q
-    edges_qs = (RelationShip.objects.filter(filtered_in)
-        if filtered_in else  RelationShip.objects.all())
 
     results = OrderedDict()
     pks_to_leafs = {}
-    roots_after_cut = []
+    parsed_extras = {}
     for root in roots:
         if isinstance(root, PageElement):
             slug = root.slug
             orig_element_id = root.pk
             title = root.title
             picture = root.picture
-            extra = root.extra
+            extra = root.extra_data
             text = root.text
         else:
             slug = root.get('slug', root.get('dest_element__slug'))
@@ -796,90 +2158,316 @@ def build_content_tree(roots=None, prefix=None, cut=None,
             base = prefix
         else:
             base = prefix + leaf_slug
-        try:
-            extra = json.loads(extra)
-        except (TypeError, ValueError):
-            pass
-        result_node = {'slug': slug, 'title': title}
-        if picture:
-            result_node.update({'picture': picture})
-        if extra:
-            result_node.update({'extra': extra})
-        if text:
-            result_node.update({'text': text})
-        pks_to_leafs[orig_element_id] = {
-            'path': base,
-            'node': (result_node, OrderedDict())
-        }
-        results.update({base: pks_to_leafs[orig_element_id]['node']})
-        if cut is None or cut.enter(extra):
-            roots_after_cut += [root]
-
-    args = tuple([])
-    edges = edges_qs.filter(
-        orig_element__in=roots_after_cut).values(
-        'orig_element_id', 'dest_element_id', 'rank', 'dest_element__slug',
-        'dest_element__extra', 'dest_element__picture', 'dest_element__title',
-        *args).order_by('rank', 'pk')
-    while edges:
+        result_node = _build_content_tree_node(slug, title,
+            picture=picture, extra=extra, text=text,
+            parsed_extras=parsed_extras, base=base)
+        results.update({base: result_node})
+        if cut is None or cut.enter(result_node.extra):
+            pks_to_leafs[orig_element_id] = result_node
+
+    if settings.CONTENT_TREE_ENGINE == 'closure':
+        _expand_content_tree_from_closure(pks_to_leafs, cut=cut,
+            filtered_in=_get_available_q(visibility=visibility,
+                accounts=accounts, field_prefix='descendant__'),
+            parsed_extras=parsed_extras)
+    elif (settings.CONTENT_TREE_ENGINE == 'recursive' and
+          connection.vendor in ('postgresql', 'sqlite')):
+        _expand_content_tree_recursive(pks_to_leafs,
+            cut=cut, filtered_in=_get_available_q(
+                visibility=visibility, accounts=accounts),
+            parsed_extras=parsed_extras)
+    else:
+        _expand_content_tree_by_level(pks_to_leafs, cut=cut,
+            filtered_in=_get_available_q(visibility=visibility,
+                accounts=accounts, field_prefix='dest_element__'),
+            parsed_extras=parsed_extras)
+    return results
+
+
+def _expand_content_tree_by_level(pks_to_leafs, cut=None, filtered_in=None,
+                                  parsed_extras=None):
+    """
+    Adds the descendants of *pks_to_leafs* into the content tree,
+    issuing one query per level in the tree.
+    """
+    # We use a breadth-first search algorithm here such as to minimize
+    # the number of queries to the database.
+    edges_qs = (RelationShip.objects.filter(filtered_in)
+        if filtered_in else  RelationShip.objects.all())
+    while pks_to_leafs:
+        edges = edges_qs.filter(
+            orig_element_id__in=pks_to_leafs.keys()).values(
+            'orig_element_id', 'dest_element_id', 'rank', 'dest_element__slug',
+            'dest_element__extra', 'dest_element__picture',
+            'dest_element__title').order_by('rank', 'pk')
         next_pks_to_leafs = {}
         for edge in edges:
             orig_element_id = edge.get('orig_element_id')
             dest_element_id = edge.get('dest_element_id')
             slug = edge.get('slug', edge.get('dest_element__slug'))
-            base = pks_to_leafs[orig_element_id]['path'] + "/" + slug
-            title = edge.get('dest_element__title')
-            picture = edge.get('dest_element__picture')
-            extra = edge.get('dest_element__extra')
-            try:
-                extra = json.loads(extra)
-            except (TypeError, ValueError):
-                pass
-            result_node = {'slug': slug, 'title': title}
-            if picture:
-                result_node.update({'picture': picture})
-            if extra:
-                result_node.update({'extra': extra})
-            text = edge.get('dest_element__text', None)
-            if text:
-                result_node.update({'text': text})
-            pivot = (result_node, OrderedDict())
-            pks_to_leafs[orig_element_id]['node'][1].update({base: pivot})
-            if cut is None or cut.enter(extra):
-                next_pks_to_leafs[dest_element_id] = {
-                    'path': base,
-                    'node': pivot
-                }
+            result_node = _build_content_tree_node(slug,
+                edge.get('dest_element__title'),
+                picture=edge.get('dest_element__picture'),
+                extra=edge.get('dest_element__extra'),
+                text=edge.get('dest_element__text', None),
+                parsed_extras=parsed_extras,
+                parent=pks_to_leafs[orig_element_id])
+            if cut is None or cut.enter(result_node.extra):
+                next_pks_to_leafs[dest_element_id] = result_node
         pks_to_leafs = next_pks_to_leafs
-        next_pks_to_leafs = {}
-        edges = edges_qs.filter(
-            orig_element_id__in=pks_to_leafs.keys()).values(
-            'orig_element_id', 'dest_element_id', 'rank', 'dest_element__slug',
-            'dest_element__extra', 'dest_element__picture',
-            'dest_element__title', *args).order_by('rank', 'pk')
-    return results
 
 
-def flatten_content_tree(roots, sort_by_key=True, depth=0):
+def _add_content_tree_level(rows, paths_to_leafs, cut=None,
+                            parsed_extras=None):
+    """
+    Adds the nodes in *rows*, all at the same depth in the content tree,
+    below their parents in *paths_to_leafs*, and returns a dictionnary
+    of the paths added to *paths_to_leafs* keyed by ``PageElement``
+    primary key.
+
+    *rows* are tuples (path, dest_element_id, slug, title, picture, extra)
+    ordered by rank. As in `_expand_content_tree_by_level`, a `PageElement`
+    reached through many parents at the same depth is added below each
+    parent, but only the last node added is further expanded.
+    """
+    #pylint:disable=too-many-arguments
+    entered = {}
+    for path, dest_element_id, slug, title, picture, extra in rows:
+        parent = paths_to_leafs.get(path[:path.rstrip('/').rfind('/') + 1])
+        if parent is None:
+            # The parent was filtered out, cut, or is not the node
+            # its `PageElement` is expanded below.
+            continue
+        result_node = _build_content_tree_node(slug, title,
+            picture=picture, extra=extra, parsed_extras=parsed_extras,
+            parent=parent)
+        if cut is None or cut.enter(result_node.extra):
+            if dest_element_id in entered:
+                del paths_to_leafs[entered[dest_element_id]]
+            entered[dest_element_id] = path
+            paths_to_leafs[path] = result_node
+    return entered
+
+
+def _expand_content_tree_recursive(pks_to_leafs, cut=None,
+                                   filtered_in=None, parsed_extras=None):
+    """
+    Adds the descendants of *pks_to_leafs* into the content tree,
+    issuing a single ``WITH RECURSIVE`` query.
+
+    *filtered_in* is a filter on ``PageElement`` that each node
+    below the roots must match.
+    """
+    paths_to_leafs = {}
+    for orig_element_id, leaf in six.iteritems(pks_to_leafs):
+        paths_to_leafs[
+            RelationShipClosure.objects.get_path(orig_element_id)] = leaf
+    rows = _get_content_tree_recursive_rows(pks_to_leafs.keys(), cut=cut,
+        filtered_in=filtered_in)
+    while rows:
+        depth = rows[0][0]
+        level_end = 0
+        while level_end < len(rows) and rows[level_end][0] == depth:
+            level_end += 1
+        level, rows = rows[:level_end], rows[level_end:]
+        entered = _add_content_tree_level([row[3:9] for row in level],
+            paths_to_leafs, cut=cut, parsed_extras=parsed_extras)
+        expands = {row[3]: row[-1] for row in level}
+        pruned = {dest_element_id: path
+            for dest_element_id, path in six.iteritems(entered)
+            if not expands[path]}
+        if pruned:
+            # The subtrees below false positives of the cut were not
+            # retrieved. We fetch them and merge them with the next levels.
+            for row in _get_content_tree_recursive_rows(pruned.keys(),
+                    cut=cut, filtered_in=filtered_in):
+                path = row[3]
+                root_path = path[:path.find('/', 1) + 1]
+                rows += [(row[0] + depth,) + row[1:3] + (
+                    pruned[int(root_path.strip('/'))]
+                    + path[len(root_path):],) + row[4:]]
+            rows.sort(key=lambda row: row[:3])
+
+
+def _get_content_tree_recursive_rows(pks, cut=None, filtered_in=None):
+    """
+    Returns the paths below *pks* in the content DAG as tuples
+    (depth, rank, edge_id, path, dest_element_id, slug, title, picture,
+    extra, expand) ordered by depth, rank and edge.
+
+    Paths are not expanded below nodes the content tree is cut at,
+    as far as the database can tell (see `_get_cut_q`). `expand` is 0
+    for those nodes.
+    """
+    pks = list(pks)
+    if not pks:
+        return []
+    params = {'relationship': connection.ops.quote_name(
+        RelationShip._meta.db_table),
+        'pageelement': connection.ops.quote_name(PageElement._meta.db_table),
+        'roots': ','.join(['%s'] * len(pks)),
+        'filtered_in': "",
+        'expand': "1"}
+    filtered_in_params = []
+    if filtered_in:
+        filtered_in_sql, filtered_in_params = PageElement.objects.filter(
+            filtered_in).values('pk').query.sql_with_params()
+        params.update({'filtered_in': "AND elem.id IN (%s)" % filtered_in_sql})
+    expand_params = []
+    cut_q = _get_cut_q(cut)
+    if cut_q is not None:
+        # The subtrees below nodes tagged with the cut tag are pruned
+        # in SQL.
+        cut_sql, expand_params = PageElement.objects.filter(
+            cut_q).values('pk').query.sql_with_params()
+        params.update({'expand':
+            "CASE WHEN elem.id IN (%s) THEN 0 ELSE 1 END" % cut_sql})
+        expand_params = list(expand_params)
+    elif cut is not None and cut.match:
+        # Implementation Note: We only prune in SQL the subtrees below
+        # nodes whose `extra` field contains the cut tag. `cut.enter` is
+        # the final arbiter and the few false positives are expanded
+        # through a follow-up query.
+        params.update({'expand': "CASE WHEN elem.extra %s THEN 0 ELSE 1 END"
+            % (connection.operators['contains'] % '%s')})
+        expand_params = ["%%%s%%" % connection.ops.prep_for_like_query(
+            cut.match)]
+    sql = """WITH RECURSIVE content_tree(dest_element_id, rank, edge_id, depth,
+  path, expand) AS (
+SELECT edge.dest_element_id, edge.rank, edge.id, 1,
+  '/' || CAST(edge.orig_element_id AS VARCHAR(255)) || '/' ||
+  CAST(edge.dest_element_id AS VARCHAR(255)) || '/', %(expand)s
+FROM %(relationship)s edge
+INNER JOIN %(pageelement)s elem ON elem.id = edge.dest_element_id
+WHERE edge.orig_element_id IN (%(roots)s) %(filtered_in)s
+UNION ALL
+SELECT edge.dest_element_id, edge.rank, edge.id, content_tree.depth + 1,
+  content_tree.path || CAST(edge.dest_element_id AS VARCHAR(255)) || '/',
+  %(expand)s
+FROM content_tree
+INNER JOIN %(relationship)s edge
+ON edge.orig_element_id = content_tree.dest_element_id
+INNER JOIN %(pageelement)s elem ON elem.id = edge.dest_element_id
+WHERE content_tree.expand = 1 %(filtered_in)s
+)
+SELECT content_tree.depth, content_tree.rank, content_tree.edge_id,
+  content_tree.path, content_tree.dest_element_id,
+  elem.slug, elem.title, elem.picture, elem.extra, content_tree.expand
+FROM content_tree
+INNER JOIN %(pageelement)s elem ON elem.id = content_tree.dest_element_id
+ORDER BY content_tree.depth, content_tree.rank, content_tree.edge_id""" % params
+    with connection.cursor() as cursor:
+        cursor.execute(sql, expand_params + pks
+            + list(filtered_in_params) + expand_params
+            + list(filtered_in_params))
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def _expand_content_tree_from_closure(pks_to_leafs, cut=None,
+                                      filtered_in=None, parsed_extras=None):
+    """
+    Adds the descendants of *pks_to_leafs* into the content tree,
+    issuing a single query on the ``RelationShipClosure`` table.
+    """
+    paths_to_leafs = {}
+    for orig_element_id, leaf in six.iteritems(pks_to_leafs):
+        paths_to_leafs[
+            RelationShipClosure.objects.get_path(orig_element_id)] = leaf
+    if not paths_to_leafs:
+        return
+    closures_qs = RelationShipClosure.objects.filter(
+        ancestor_id__in=pks_to_leafs.keys())
+    if filtered_in:
+        closures_qs = closures_qs.filter(filtered_in)
+    cut_q = _get_cut_q(cut, field_prefix='descendant__')
+    if cut_q is not None:
+        # Skips paths going through a node the tree is cut at, such that
+        # the subtrees below those nodes are never fetched.
+        closures_qs = closures_qs.exclude(models.Exists(
+            RelationShipClosure.objects.filter(cut_q,
+                ancestor_id=models.OuterRef('ancestor_id'),
+                depth__lt=models.OuterRef('depth')).annotate(
+                descendant_path=models.ExpressionWrapper(
+                    models.OuterRef('path'),
+                    output_field=models.CharField())).filter(
+                descendant_path__startswith=models.F('path'))))
+    # Ordering by `depth` guarantees a parent path is processed before
+    # its children, hence we skip all nodes below one that was filtered out
+    # or cut.
+    closures = closures_qs.values_list('depth', 'path', 'descendant_id',
+        'descendant__slug', 'descendant__title', 'descendant__picture',
+        'descendant__extra').order_by('depth', 'rank', 'edge_id')
+    for _depth, level in itertools.groupby(closures.iterator(),
+            key=lambda closure: closure[0]):
+        _add_content_tree_level([closure[1:] for closure in level],
+            paths_to_leafs, cut=cut, parsed_extras=parsed_extras)
+
+
+def _get_content_tree_sort_key(item):
+    node = item[1]
+    #pylint:disable=protected-access
+    if isinstance(node, ContentTreeNode) and node._data is None:
+        # The data of the node was never accessed, hence not modified.
+        return (0, node.title)
+    return (node[0].get('rank', 0) if node[0].get('rank') is not None else 0,
+        node[0].get('title', ""))
+
+
+def _iter_content_tree_children(roots, sort_by_key=True, path=None):
+    """
+    Returns an iterator over the (path, node) pairs in *roots*.
+
+    *roots* is either a dictionnary of nodes keyed by path,
+    or the list of ``ContentTreeNode`` below *path*.
+    """
+    if path is not None:
+        children = ((path + "/" + child.slug, child) for child in roots)
+    else:
+        children = six.iteritems(roots)
+    if sort_by_key:
+        children = sorted(children, key=_get_content_tree_sort_key)
+    return iter(children)
+
+
+def iter_content_tree(roots, sort_by_key=True, depth=0, max_depth=None):
+    """
+    Generates the nodes of a tree in depth-first order, each node
+    with ``path`` as its key in the tree and ``indent`` as its depth
+    in the original tree (starting at *depth*).
+
+    Nodes more than *max_depth* levels below *roots* are skipped.
+    The nodes in the tree are copied, not modified.
+    """
+    stack = [_iter_content_tree_children(roots, sort_by_key=sort_by_key)]
+    while stack:
+        for key, values in stack[-1]:
+            children_path = None
+            if isinstance(values, ContentTreeNode):
+                node = dict(values.as_dict())
+                nodes = values.children
+                children_path = key
+            else:
+                elem, nodes = values
+                node = dict(elem)
+            node.update({
+                'path': key,
+                'indent': depth + len(stack) - 1
+            })
+            yield node
+            if nodes and (max_depth is None or len(stack) <= max_depth):
+                # Resumes iterating over the siblings once all
+                # the descendants of `node` were generated.
+                stack += [_iter_content_tree_children(
+                    nodes, sort_by_key=sort_by_key, path=children_path)]
+                break
+        else:
+            stack.pop()
+
+
+def flatten_content_tree(roots, sort_by_key=True, depth=0, max_depth=None):
     """
     Transforms a tree into a list with ``indent`` as the depth of a node
     in the original tree.
     """
-    results = []
-    children = six.iteritems(roots)
-    if sort_by_key:
-        children = sorted(children,
-            key=lambda node: (
-                node[1][0].get('rank', 0)
-                if node[1][0].get('rank') is not None else 0,
-                node[1][0].get('title', "")))
-    for key, values in children:
-        elem, nodes = values
-        elem.update({
-            'path': key,
-            'indent': depth
-        })
-        results += [elem]
-        results += flatten_content_tree(nodes,
-            sort_by_key=sort_by_key, depth=depth + 1)
-    return results
+    return list(iter_content_tree(roots, sort_by_key=sort_by_key,
+        depth=depth, max_depth=max_depth))
@@ -0,0 +1,335 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Full-text search on ``PageElement``
+"""
+from __future__ import unicode_literals
+
+import logging, re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import strip_tags
+
+from . import settings
+from .compat import import_string, six
+from .helpers import loads_extra
+
+
+LOGGER = logging.getLogger(__name__)
+
+_SEARCH_ENGINE = {}
+
+
+def get_search_engine():
+    """
+    Returns the search engine selected by the `SEARCH_ENGINE` setting.
+
+    `None` searches with case-insensitive `LIKE` queries, 'fulltext'
+    uses the full-text index available on the database (SQLite FTS5
+    or PostgreSQL `tsvector`) and any other value is the import path
+    to a `SearchEngine` subclass.
+    """
+    engine = _SEARCH_ENGINE.get(connection.vendor)
+    if engine is None:
+        engine_class = SearchEngine
+        if settings.SEARCH_ENGINE == 'fulltext':
+            if connection.vendor == 'sqlite':
+                engine_class = SqliteSearchEngine
+            elif connection.vendor == 'postgresql':
+                engine_class = PostgresqlSearchEngine
+            else:
+                LOGGER.warning("no full-text search engine for %s,"\
+                    " defaults to LIKE queries.", connection.vendor)
+        elif settings.SEARCH_ENGINE:
+            engine_class = import_string(settings.SEARCH_ENGINE)
+        engine = engine_class()
+        _SEARCH_ENGINE[connection.vendor] = engine
+    return engine
+
+
+class SearchEngine(object):
+    """
+    Searches the title, text and tags of `PageElement` with
+    case-insensitive `LIKE` queries. There is no index to maintain.
+    """
+
+    def create_index(self):
+        """
+        Creates the tables used by the index if they do not exist yet.
+        This is done by the `rebuild_search_index` command.
+        """
+
+    def index(self, elements):
+        """
+        Adds or updates *elements* in the index.
+        """
+
+    def remove(self, element_ids):
+        """
+        Removes the elements whose primary keys are in *element_ids*
+        from the index.
+        """
+
+    def rebuild(self, queryset, batch_size=1000):
+        """
+        Indexes all elements in *queryset* from scratch.
+        """
+        self.clear()
+        elements = []
+        for element in queryset.order_by('pk').iterator():
+            elements += [element]
+            if len(elements) >= batch_size:
+                self.index(elements)
+                elements = []
+        if elements:
+            self.index(elements)
+
+    def clear(self):
+        """
+        Removes all elements from the index.
+        """
+
+    def search(self, queryset, search_string, searchable_only=False):
+        """
+        Returns the elements in *queryset* that match *search_string*,
+        most relevant first.
+
+        When *searchable_only* is `True`, only elements whose `extra`
+        field has `searchable` set are returned.
+        """
+        search_q = None
+        for term in search_string.split():
+            term_q = (Q(title__icontains=term) | Q(text__icontains=term)
+                | Q(extra__icontains=term))
+            search_q = (search_q & term_q) if search_q else term_q
+        if search_q:
+            queryset = queryset.filter(search_q)
+        if searchable_only:
+            queryset = queryset.filter(extra__regex=r'"searchable":\s*true')
+        return queryset.order_by('title')
+
+    @staticmethod
+    def get_document(element):
+        """
+        Returns the title, text and tags of *element* as plain text.
+        """
+        extra = loads_extra(element.extra)
+        if not isinstance(extra, dict):
+            extra = {}
+        tags = extra.get('tags', [])
+        if not isinstance(tags, list):
+            tags = [tags]
+        return (element.title or "", strip_tags(element.text or ""),
+            " ".join([six.text_type(tag) for tag in tags]),
+            bool(extra.get('searchable', False)))
+
+    @staticmethod
+    def get_terms(search_string):
+        return [term for term in re.split(r'\W+', search_string,
+            flags=re.UNICODE) if term]
+
+
+class _TableSearchEngine(SearchEngine):
+    """
+    Search engine whose index is stored in the table `table_name`.
+    """
+    table_name = None
+    element_id_column = None
+    searchable_where = None
+
+    def __init__(self):
+        self._table_checked = False
+
+    def _check_table(self, cursor):
+        if not self._table_checked:
+            if self.table_name not in connection.introspection.table_names(
+                    cursor):
+                raise ImproperlyConfigured("%s does not exist. Run"\
+                    " `python manage.py rebuild_search_index` before setting"\
+                    " SEARCH_ENGINE to 'fulltext'." % self.table_name)
+            self._table_checked = True
+
+    def _search_all(self, queryset, searchable_only=False):
+        """
+        Returns all elements in *queryset*, ordered by title, filtering
+        searchable ones through the index rather than scanning `extra`.
+        """
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+        if searchable_only:
+            queryset = queryset.extra(where=["pages_pageelement.id IN"\
+                " (SELECT %(element_id)s FROM %(table)s WHERE %(searchable)s)"
+                % {'element_id': self.element_id_column,
+                   'table': self.table_name,
+                   'searchable': self.searchable_where}])
+        return queryset.order_by('title')
+
+
+class SqliteSearchEngine(_TableSearchEngine):
+    """
+    Searches `PageElement` through a SQLite FTS5 virtual table whose rowid
+    is the `PageElement` primary key.
+    """
+    table_name = 'pages_pageelement_fts'
+    element_id_column = 'rowid'
+    searchable_where = 'searchable = 1'
+
+    def create_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS %s USING"\
+                " fts5(title, text, tags, searchable UNINDEXED,"\
+                " tokenize='porter unicode61')" % self.table_name)
+
+    def index(self, elements):
+        elements = [element for element in elements if element.pk]
+        if not elements:
+            return
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+            cursor.execute("DELETE FROM %s WHERE rowid IN (%s)" % (
+                self.table_name, ",".join(["%s"] * len(elements))),
+                [element.pk for element in elements])
+            cursor.executemany("INSERT INTO %s"\
+                " (rowid, title, text, tags, searchable)"\
+                " VALUES (%%s, %%s, %%s, %%s, %%s)" % self.table_name,
+                [(element.pk,) + self.get_document(element)
+                 for element in elements])
+
+    def remove(self, element_ids):
+        element_ids = list(element_ids)
+        if not element_ids:
+            return
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+            cursor.execute("DELETE FROM %s WHERE rowid IN (%s)" % (
+                self.table_name, ",".join(["%s"] * len(element_ids))),
+                element_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+            cursor.execute("DELETE FROM %s" % self.table_name)
+
+    def search(self, queryset, search_string, searchable_only=False):
+        terms = self.get_terms(search_string)
+        if not terms:
+            return self._search_all(queryset, searchable_only=searchable_only)
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+        # Each term is matched as a prefix, title and tags weight more
+        # than text in the relevance.
+        match = " ".join(['"%s"*' % term.replace('"', '""')
+            for term in terms])
+        searchable = " AND searchable = 1" if searchable_only else ""
+        return queryset.extra(
+            select={'search_rank': "SELECT bm25(%(table)s, 10.0, 1.0, 5.0)"\
+                " FROM %(table)s WHERE %(table)s MATCH %%s"\
+                " AND %(table)s.rowid = pages_pageelement.id" % {
+                'table': self.table_name}},
+            select_params=(match,),
+            where=["pages_pageelement.id IN (SELECT rowid FROM %(table)s"\
+                " WHERE %(table)s MATCH %%s%(searchable)s)" % {
+                'table': self.table_name, 'searchable': searchable}],
+            params=(match,)).order_by('search_rank', 'title')
+
+
+class PostgresqlSearchEngine(_TableSearchEngine):
+    """
+    Searches `PageElement` through a table of `tsvector` documents
+    with a GIN index.
+    """
+    table_name = 'pages_pageelement_search'
+    element_id_column = 'element_id'
+    searchable_where = 'searchable'
+    config = 'english'
+
+    def create_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE IF NOT EXISTS %(table)s ("\
+                "element_id integer PRIMARY KEY REFERENCES"\
+                " pages_pageelement (id) ON DELETE CASCADE,"\
+                " searchable boolean NOT NULL DEFAULT false,"\
+                " document tsvector NOT NULL)" % {'table': self.table_name})
+            cursor.execute("CREATE INDEX IF NOT EXISTS %(table)s_document"\
+                " ON %(table)s USING GIN (document)" % {
+                'table': self.table_name})
+
+    def index(self, elements):
+        elements = [element for element in elements if element.pk]
+        if not elements:
+            return
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+            cursor.executemany("INSERT INTO %(table)s"\
+                " (element_id, searchable, document) VALUES (%%s, %%s,"\
+                " setweight(to_tsvector(%%s, %%s), 'A') ||"\
+                " setweight(to_tsvector(%%s, %%s), 'B') ||"\
+                " setweight(to_tsvector(%%s, %%s), 'A'))"\
+                " ON CONFLICT (element_id) DO UPDATE SET"\
+                " searchable = EXCLUDED.searchable,"\
+                " document = EXCLUDED.document" % {'table': self.table_name},
+                [self._get_params(element) for element in elements])
+
+    def _get_params(self, element):
+        title, text, tags, searchable = self.get_document(element)
+        return (element.pk, searchable, self.config, title,
+            self.config, text, self.config, tags)
+
+    def remove(self, element_ids):
+        element_ids = list(element_ids)
+        if not element_ids:
+            return
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+            cursor.execute("DELETE FROM %s WHERE element_id IN (%s)" % (
+                self.table_name, ",".join(["%s"] * len(element_ids))),
+                element_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+            cursor.execute("DELETE FROM %s" % self.table_name)
+
+    def search(self, queryset, search_string, searchable_only=False):
+        terms = self.get_terms(search_string)
+        if not terms:
+            return self._search_all(queryset, searchable_only=searchable_only)
+        with connection.cursor() as cursor:
+            self._check_table(cursor)
+        # Each term is matched as a prefix.
+        query = " & ".join(["%s:*" % term for term in terms])
+        searchable = " AND searchable" if searchable_only else ""
+        return queryset.extra(
+            select={'search_rank': "SELECT ts_rank(document,"\
+                " to_tsquery(%%s, %%s)) FROM %(table)s"\
+                " WHERE element_id = pages_pageelement.id" % {
+                'table': self.table_name}},
+            select_params=(self.config, query),
+            where=["pages_pageelement.id IN (SELECT element_id"\
+                " FROM %(table)s WHERE document @@ to_tsquery(%%s, %%s)"\
+                "%(searchable)s)" % {
+                'table': self.table_name, 'searchable': searchable}],
+            params=(self.config, query)).order_by('-search_rank', 'title')
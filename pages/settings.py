@@ -42,6 +42,8 @@ _SETTINGS = {
                 None)),
     'BUCKET_NAME_FROM_FIELDS': ['bucket_name'],
     'COMMENT_MAX_LENGTH': getattr(settings, 'COMMENT_MAX_LENGTH', 3000),
+    'CONTENT_TREE_CACHE': None,
+    'CONTENT_TREE_ENGINE': None,
     'DEFAULT_ACCOUNT_CALLABLE': '',
     'DEFAULT_STORAGE_CALLABLE': '',
     'EXTRA_FIELD': None,
@@ -49,7 +51,9 @@ _SETTINGS = {
     'MEDIA_PREFIX': "",
     'MEDIA_ROOT': getattr(settings, 'MEDIA_ROOT'),
     'MEDIA_URL': getattr(settings, 'MEDIA_URL'),
-    'PING_INTERVAL': getattr(settings, 'PING_INTERVAL', 10)
+    'PING_FLUSH_INTERVAL': None,
+    'PING_INTERVAL': getattr(settings, 'PING_INTERVAL', 10),
+    'SEARCH_ENGINE': None
 }
 
 _SETTINGS.update(getattr(settings, 'PAGES', {}))
@@ -63,6 +67,8 @@ AWS_SERVER_SIDE_ENCRYPTION = _SETTINGS.get('AWS_SERVER_SIDE_ENCRYPTION')
 AWS_STORAGE_BUCKET_NAME = _SETTINGS.get('AWS_STORAGE_BUCKET_NAME')
 BUCKET_NAME_FROM_FIELDS = _SETTINGS.get('BUCKET_NAME_FROM_FIELDS')
 COMMENT_MAX_LENGTH = _SETTINGS.get('COMMENT_MAX_LENGTH')
+CONTENT_TREE_CACHE = _SETTINGS.get('CONTENT_TREE_CACHE')
+CONTENT_TREE_ENGINE = _SETTINGS.get('CONTENT_TREE_ENGINE')
 DEFAULT_ACCOUNT_CALLABLE = _SETTINGS.get('DEFAULT_ACCOUNT_CALLABLE')
 DEFAULT_STORAGE_CALLABLE = _SETTINGS.get('DEFAULT_STORAGE_CALLABLE')
 EXTRA_FIELD = _SETTINGS.get('EXTRA_FIELD')
@@ -70,7 +76,9 @@ HTTP_REQUESTS_TIMEOUT = _SETTINGS.get('HTTP_REQUESTS_TIMEOUT')
 MEDIA_PREFIX = _SETTINGS.get('MEDIA_PREFIX')
 MEDIA_ROOT = _SETTINGS.get('MEDIA_ROOT')
 MEDIA_URL = _SETTINGS.get('MEDIA_URL')
+PING_FLUSH_INTERVAL = _SETTINGS.get('PING_FLUSH_INTERVAL')
 PING_INTERVAL = _SETTINGS.get('PING_INTERVAL')
+SEARCH_ENGINE = _SETTINGS.get('SEARCH_ENGINE')
 
 LANGUAGE_CODE = getattr(settings, 'LANGUAGE_CODE')
 SLUG_RE = r'[a-zA-Z0-9_\-\+\.]+'
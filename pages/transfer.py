@@ -0,0 +1,256 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Import and export of content trees as JSON Lines
+
+Each line describes a node in a content tree. The `path` of a node
+(ex: "/metal/boxes-and-enclosures") is made of the slugs of the nodes
+leading to it from a root of the exported tree. A node reachable through
+more than one path is fully described on its first line only.
+
+.. code-block:: json
+
+    {"path": "/metal", "slug": "metal", "title": "Metal", ...}
+    {"path": "/metal/boxes", "slug": "boxes", "title": "Boxes", ...}
+"""
+from __future__ import unicode_literals
+
+import json, logging
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_duration
+from django.utils.duration import duration_string
+from rest_framework.exceptions import ValidationError
+
+from . import settings
+from .api.serializers import clean_html
+from .compat import gettext_lazy as _, six
+from .helpers import loads_extra
+from .models import (ElementTag, PageElement, RelationShip,
+    RelationShipClosure, _dump_extra, build_content_tree,
+    invalidate_content_tree, iter_content_tree)
+from .search import get_search_engine
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Fields of a ``PageElement`` copied as is to and from a line.
+TRANSFER_FIELDS = ('title', 'content_format', 'text', 'picture', 'lang')
+
+
+def _iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch += [item]
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_content_tree(roots=None, batch_size=100):
+    """
+    Generates the lines, terminated by a newline, describing the content
+    trees rooted at *roots* (all roots in the content DAG when `None`).
+
+    The content tree of a root is built only once all lines for
+    the previous roots were generated. Page elements are loaded
+    *batch_size* at a time as the content tree is traversed.
+    """
+    if roots is None:
+        roots = PageElement.objects.get_roots().order_by('title', 'pk')
+    exported = set([])
+    for root in roots:
+        content_tree = build_content_tree(
+            roots=[root], prefix='/%s' % root.slug)
+        for batch in _iter_batches(iter_content_tree(
+                content_tree, sort_by_key=False), batch_size):
+            for line in _export_batch(batch, exported):
+                yield line
+
+
+def _export_batch(nodes, exported):
+    elements = {element.slug: element
+        for element in PageElement.objects.filter(slug__in=set([
+            node['slug'] for node in nodes
+            if node['slug'] not in exported]))}
+    for node in nodes:
+        line = {'path': node['path'], 'slug': node['slug']}
+        element = elements.get(node['slug'])
+        if element is not None and element.slug not in exported:
+            exported |= set([element.slug])
+            for field_name in TRANSFER_FIELDS:
+                line.update({field_name: getattr(element, field_name)})
+            if element.reading_time is not None:
+                line.update({
+                    'reading_time': duration_string(element.reading_time)})
+            if element.extra_data:
+                line.update({'extra': element.extra_data})
+        yield json.dumps(line) + "\n"
+
+
+def _iter_records(lines):
+    for line_no, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        path = record.get('path') if isinstance(record, dict) else None
+        if not path or not isinstance(path, six.string_types):
+            raise ValidationError({'detail': _("line %(line_no)d is not"\
+                " a JSON object with a path.") % {'line_no': line_no}})
+        parts = path.strip('/').split('/')
+        record.update({
+            'slug': record.get('slug') or parts[-1],
+            'parent': parts[-2] if len(parts) > 1 else None,
+            'line_no': line_no})
+        yield record
+
+
+def _create_element(record, account=None):
+    element = PageElement(account=account)
+    for field_name in TRANSFER_FIELDS:
+        if record.get(field_name) is not None:
+            setattr(element, field_name, record.get(field_name))
+    # Imported HTML is sanitized as it is when submitted
+    # through the editables API.
+    if element.content_format == 'HTML' and element.text:
+        element.text = clean_html(element.text,
+            tags=settings.ALLOWED_TAGS,
+            attributes=settings.ALLOWED_ATTRIBUTES)
+    if '<' in element.title:
+        # Titles are plain text. We only strip markup such that
+        # characters like '&' are kept as is.
+        element.title = clean_html(element.title,
+            tags=[], attributes={}, strip=True)
+    if record.get('reading_time'):
+        element.reading_time = parse_duration(record.get('reading_time'))
+    extra = loads_extra(record.get('extra'))
+    if extra:
+        element.extra = _dump_extra(extra)
+    return element
+
+
+def import_content_tree(lines, parent=None, account=None, batch_size=1000):
+    """
+    Creates the content trees described in *lines*, attaches their roots
+    under *parent* (when not `None`) and returns the created roots.
+
+    Page elements and edges are inserted in bulk, *batch_size* lines
+    at a time. A node must be described before its children, as it is
+    in the output of ``export_content_tree``. The slugs in *lines* are
+    only used to link the nodes together; created page elements are
+    assigned new slugs when those are already used.
+    """
+    #pylint:disable=too-many-locals
+    with transaction.atomic():
+        elements = {} # slug in `lines` -> created ``PageElement``
+        roots = []
+        edges = []
+        edge_keys = set([])
+        next_ranks = {}
+        # `bulk_create` does not set primary keys on some databases
+        # (ex: MySQL), in which case rows are saved one at a time
+        # and signals update the closure table, tags, search index
+        # and root/leaf flags.
+        bulk = connection.features.can_return_rows_from_bulk_insert
+        for records in _iter_batches(_iter_records(lines), batch_size):
+            new_elements = []
+            new_slugs = []
+            for record in records:
+                if record['slug'] not in elements:
+                    element = _create_element(record, account=account)
+                    elements[record['slug']] = element
+                    new_elements += [element]
+                    new_slugs += [record['slug']]
+            for element, slug in zip(new_elements,
+                    PageElement.objects.get_unique_slugs(new_slugs)):
+                element.slug = slug
+
+            new_edges = []
+            for record in records:
+                element = elements[record['slug']]
+                if record['parent'] is None:
+                    if element not in roots:
+                        roots += [element]
+                    continue
+                orig_element = elements.get(record['parent'])
+                if orig_element is None:
+                    raise ValidationError({'detail': _("line %(line_no)d:"\
+                        " %(parent)s must be described before its children.")
+                        % {'line_no': record['line_no'],
+                           'parent': record['parent']}})
+                edge_key = (id(orig_element), id(element))
+                if edge_key in edge_keys:
+                    continue
+                edge_keys |= set([edge_key])
+                rank = next_ranks.get(id(orig_element), 0)
+                next_ranks[id(orig_element)] = rank + RelationShip.RANK_GAP
+                new_edges += [RelationShip(orig_element=orig_element,
+                    dest_element=element, rank=rank)]
+
+            if bulk:
+                # Signals are not sent on `bulk_create` so we update the tags
+                # and search index here, and the closure table and root/leaf
+                # flags once all edges were inserted.
+                PageElement.objects.bulk_create(new_elements)
+                RelationShip.objects.bulk_create(new_edges)
+                ElementTag.objects.create_tags(new_elements)
+                get_search_engine().index(new_elements)
+                edges += new_edges
+            else:
+                for element in new_elements:
+                    element.save()
+                for edge in new_edges:
+                    edge.save()
+            LOGGER.debug("imported %d page elements and %d edges",
+                len(new_elements), len(new_edges))
+
+        if bulk:
+            RelationShipClosure.objects.insert_subtree(edges)
+            pks = [element.pk for element in six.itervalues(elements)]
+            for idx in range(0, len(pks), batch_size):
+                PageElement.objects.update_roots_and_leafs(
+                    pks[idx:idx + batch_size])
+        if parent is not None:
+            rank = RelationShip.objects.filter(
+                orig_element=parent).aggregate(Max('rank')).get(
+                'rank__max', None)
+            rank = 0 if rank is None else rank + RelationShip.RANK_GAP
+            for root in roots:
+                # Closure rows and root/leaf flags are updated
+                # by the `post_save` signal.
+                RelationShip.objects.create(
+                    orig_element=parent, dest_element=root, rank=rank)
+                rank += RelationShip.RANK_GAP
+        invalidate_content_tree()
+    return roots
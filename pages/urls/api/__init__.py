@@ -26,6 +26,7 @@
 API URLs for the pages application
 """
 
+from ... import settings
 from ...api.newsfeed import NewsFeedListAPIView
 from ...compat import include, path
 
@@ -41,3 +42,10 @@ urlpatterns = [
     path('progress/', include('pages.urls.api.progress')),
     path('', include('pages.urls.api.assets'))
 ]
+
+if settings.ACCOUNT_URL_KWARG:
+    # Attendance is only recorded in bulk on behalf of a provider.
+    urlpatterns += [
+        path('attendance/<slug:%s>/' % settings.ACCOUNT_URL_KWARG,
+            include('pages.urls.api.attendance')),
+    ]
@@ -28,7 +28,7 @@ API URLs for editing content
 from ... import settings
 from ...compat import path, re_path
 from ...api.elements import (ImportDocxView, PageElementEditableDetail,
-    PageElementEditableListAPIView)
+    PageElementEditableListAPIView, PageElementTransferAPIView)
 from ...api.relationship import (PageElementAliasAPIView,
     PageElementMirrorAPIView, PageElementMoveAPIView)
 from ...api.sequences import (SequenceListCreateAPIView,
@@ -58,6 +58,9 @@ urlpatterns = [
         PageElementMoveAPIView.as_view(), name='pages_api_move_node'),
     re_path('^content/mirror/(?P<path>%s)$' % settings.PATH_RE,
         PageElementMirrorAPIView.as_view(), name='pages_api_mirror_node'),
+    re_path('^content/transfer/(?P<path>%s)$' % settings.PATH_RE,
+        PageElementTransferAPIView.as_view(),
+        name='pages_api_transfer_content'),
     path('content/<path:path>/import',
          ImportDocxView.as_view(), name='import_docx'),
     path('content/<path:path>',
@@ -150,17 +150,14 @@ class CertificateDownloadView(SequenceProgressMixin, DetailView):
         })
 
         if has_completed_sequence:
-            completion_date = datetime_or_now(
+            # `is_completed` records the `completion_date`.
+            context['completion_date'] = datetime_or_now(
                 self.sequence_progress.completion_date)
-            if not self.sequence_progress.completion_date:
-                self.sequence_progress.completion_date = completion_date
-                self.sequence_progress.save()
-            context['completion_date'] = completion_date
 
         return context
 
     def get(self, request, *args, **kwargs):
-        if (self.sequence_progress.has_certificate and
+        if (self.sequence_progress.sequence.has_certificate and
             not self.sequence_progress.is_completed):
             raise PermissionDenied("Certificate is not available for download"\
                 " until you complete all elements.")
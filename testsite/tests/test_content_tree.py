@@ -0,0 +1,99 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from unittest import mock
+
+from django.test import TestCase
+
+from pages import settings
+from pages.helpers import ContentCut
+from pages.models import (PageElement, RelationShip, build_content_tree,
+    flatten_content_tree)
+
+
+class ContentTreeEnginesTests(TestCase):
+
+    engines = (None, 'recursive', 'closure')
+
+    def setUp(self):
+        # A DAG where elements are reached through many parents, at the same
+        # depth and at different depths.
+        elements = {slug: PageElement.objects.create(slug=slug, title=slug,
+            extra='{"pagebreak": true}' if slug == 'g' else None)
+            for slug in 'abcdefgh'}
+        for rank, (orig, dest) in enumerate(['ab', 'ac', 'ad', 'bd', 'be',
+                'cd', 'ce', 'cg', 'de', 'df', 'ef', 'eh', 'gh', 'dg']):
+            RelationShip.objects.create(orig_element=elements[orig],
+                dest_element=elements[dest], rank=rank % 3)
+        self.root = elements['a']
+
+    def dump(self, nodes):
+        results = []
+        for path, node in nodes.items():
+            results += [(path, node[0], self.dump(node[1]))]
+        return results
+
+    def assertSameTrees(self, **kwargs):
+        trees = []
+        for engine in self.engines:
+            with mock.patch.object(settings, 'CONTENT_TREE_ENGINE', engine):
+                trees += [self.dump(build_content_tree(**kwargs))]
+        for tree in trees[1:]:
+            self.assertEqual(tree, trees[0])
+
+    def test_shared_children(self):
+        self.assertSameTrees()
+        self.assertSameTrees(roots=[self.root], prefix='/a')
+
+    def test_shared_children_with_cut(self):
+        self.assertSameTrees(cut=ContentCut())
+        self.assertSameTrees(roots=[self.root], prefix='/a', cut=ContentCut())
+
+
+class ContentTreeNodeTests(TestCase):
+
+    def setUp(self):
+        root = PageElement.objects.create(slug='metal', title="Metal")
+        RelationShip.objects.create(orig_element=root,
+            dest_element=PageElement.objects.create(slug='boxes',
+            title="Boxes"))
+        self.root = root
+
+    def test_data_changes_are_kept(self):
+        tree = build_content_tree(roots=[self.root], prefix='/metal')
+        node = tree['/metal']
+        node[0]['title'] = "Metal structures"
+        data, children = node
+        self.assertEqual(data['title'], "Metal structures")
+        for child in children.values():
+            child[0].update({'rank': 1})
+        flat = flatten_content_tree(tree)
+        self.assertEqual(flat[0]['title'], "Metal structures")
+        self.assertEqual(flat[1]['rank'], 1)
+        self.assertNotIn('path', node[0])
+
+    def test_children_are_read_only(self):
+        tree = build_content_tree(roots=[self.root], prefix='/metal')
+        with self.assertRaises(TypeError):
+            tree['/metal'][1]['/metal/other'] = tree['/metal']
@@ -0,0 +1,78 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from bs4 import BeautifulSoup
+from django.test import SimpleTestCase
+
+from pages.models import get_first_paragraph
+
+
+class FirstParagraphTests(SimpleTestCase):
+
+    def assertSameFirstParagraph(self, html):
+        expected = BeautifulSoup(html, 'html5lib').find('p')
+        found = BeautifulSoup(get_first_paragraph(html), 'html5lib').find('p')
+        self.assertEqual(str(found), str(expected))
+
+    def test_paragraphs(self):
+        self.assertSameFirstParagraph("<h1>Title</h1><p>First</p><p>Next</p>")
+        self.assertSameFirstParagraph("<div><p>First<div>Next</div></div>")
+        self.assertSameFirstParagraph("<p>First <b>bold</b><p>Next")
+
+    def test_self_closing_paragraph(self):
+        self.assertSameFirstParagraph("<p/>text")
+        self.assertSameFirstParagraph("<p/>text<p>Next</p>")
+        self.assertSameFirstParagraph("<br/><p/>text <em>more</em></p>")
+
+    def test_raw_text_elements(self):
+        for tag in ('xmp', 'plaintext', 'iframe', 'noembed', 'noframes'):
+            self.assertSameFirstParagraph(
+                "<%(tag)s><p>Not a paragraph</p></%(tag)s><p>First</p>" % {
+                'tag': tag})
+            self.assertSameFirstParagraph(
+                "<p>First <%(tag)s></p><p>raw</%(tag)s></p><p>Next</p>" % {
+                'tag': tag})
+
+    def test_title_is_raw_text(self):
+        self.assertSameFirstParagraph("<title><p>Not a paragraph</title>"\
+            "<p>First</p>")
+        self.assertSameFirstParagraph("<p>First <title></p><p></title>")
+
+    def test_self_closing_raw_text_elements(self):
+        for tag in ('script', 'style'):
+            self.assertSameFirstParagraph(
+                "<%(tag)s/><p>Not a paragraph</p>" % {'tag': tag})
+            self.assertSameFirstParagraph(
+                "<p>First <%(tag)s/></p><p>Next</p>" % {'tag': tag})
+
+    def test_button_scope(self):
+        self.assertSameFirstParagraph("<p>First<button><div>In button</div>"\
+            "</button> end</p>")
+        self.assertSameFirstParagraph("<button><p>First</button>end</p>")
+        for tag in ('applet', 'marquee', 'object'):
+            self.assertSameFirstParagraph(
+                "<p>First<%(tag)s><p>Next</p></%(tag)s> end" % {'tag': tag})
+
+    def test_frameset(self):
+        self.assertSameFirstParagraph("<dl><p><dl><frameset>")
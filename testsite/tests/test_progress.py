@@ -0,0 +1,99 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import datetime
+import json
+from unittest import mock
+
+from deployutils.helpers import datetime_or_now
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from pages import settings
+from pages.models import (EnumeratedElements, EnumeratedProgress,
+    PageElement, Sequence, SequenceProgress)
+
+
+class EnumeratedProgressBatchTests(TestCase):
+
+    def setUp(self):
+        user_model = get_user_model()
+        self.provider = user_model.objects.create_user('alliance')
+        self.staff = user_model.objects.create_user('admin', is_staff=True)
+        user_model.objects.create_user('steve')
+        element = PageElement.objects.create(slug='ghg-emissions',
+            title="GHG emissions")
+        EnumeratedElements.objects.create(rank=1, content=element,
+            sequence=Sequence.objects.create(slug='ghg-accounting',
+                account=self.provider))
+        EnumeratedElements.objects.create(rank=1, content=element,
+            sequence=Sequence.objects.create(slug='other-training',
+                account=self.staff))
+        self.client.force_login(self.staff)
+
+    def test_records_elapsed_as_submitted(self):
+        resp = self.client.post('/api/attendance/alliance/', json.dumps([{
+            'user': 'steve', 'sequence': 'ghg-accounting', 'rank': 1,
+            'elapsed': "01:00:00"}]), content_type='application/json')
+        self.assertEqual(resp.status_code, 200)
+        progress = EnumeratedProgress.objects.get(
+            step__sequence__slug='ghg-accounting')
+        self.assertEqual(progress.viewing_duration,
+            datetime.timedelta(hours=1))
+
+    def test_rejects_sequences_of_other_providers(self):
+        resp = self.client.post('/api/attendance/alliance/', json.dumps([{
+            'user': 'steve', 'sequence': 'ghg-accounting', 'rank': 1,
+            'elapsed': "00:10:00"}, {
+            'user': 'steve', 'sequence': 'other-training', 'rank': 1,
+            'elapsed': "00:10:00"}]), content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(EnumeratedProgress.objects.exists())
+
+
+class EnumeratedProgressPingTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('steve')
+        sequence = Sequence.objects.create(slug='ghg-accounting')
+        step = EnumeratedElements.objects.create(rank=1, sequence=sequence,
+            content=PageElement.objects.create(slug='ghg-emissions',
+                title="GHG emissions"))
+        self.progress = EnumeratedProgress.objects.create(step=step,
+            sequence_progress=SequenceProgress.objects.create(
+                sequence=sequence, user=user))
+
+    def test_buffered_pings_make_no_writes(self):
+        at_time = datetime_or_now()
+        with mock.patch.object(settings, 'PING_FLUSH_INTERVAL', 1000):
+            with self.assertNumQueries(0):
+                for seconds in (0, 5, 10):
+                    EnumeratedProgress.objects.record_ping(self.progress,
+                        at_time=at_time + datetime.timedelta(seconds=seconds))
+            EnumeratedProgress.objects.flush_pings()
+        progress = EnumeratedProgress.objects.get(pk=self.progress.pk)
+        self.assertEqual(progress.viewing_duration,
+            datetime.timedelta(seconds=settings.PING_INTERVAL + 10))
+        self.assertEqual(progress.last_ping_time,
+            at_time + datetime.timedelta(seconds=10))
@@ -0,0 +1,70 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from pages.models import Follow, PageElement, Vote
+
+
+class ReactionCountsTests(TestCase):
+
+    def setUp(self):
+        self.element = PageElement.objects.create(slug='metal', title="Metal")
+        self.users = [get_user_model().objects.create_user(username)
+            for username in ('alice', 'steve')]
+
+    def assertCounts(self, nb_upvotes, nb_followers):
+        element = PageElement.objects.get(pk=self.element.pk)
+        self.assertEqual(element.nb_upvotes, nb_upvotes)
+        self.assertEqual(element.nb_followers, nb_followers)
+
+    def test_votes_and_follows(self):
+        for user in self.users:
+            Vote.objects.vote_up(self.element, user)
+            Follow.objects.subscribe(self.element, user)
+        Vote.objects.vote_up(self.element, self.users[0])
+        self.assertCounts(2, 2)
+        Vote.objects.vote_down(self.element, self.users[0])
+        Follow.objects.unsubscribe(self.element, self.users[0])
+        self.assertCounts(1, 1)
+        self.assertEqual(self.element.nb_upvotes, 1)
+
+    def test_cascade_deletes(self):
+        for user in self.users:
+            Vote.objects.vote_up(self.element, user)
+            Follow.objects.subscribe(self.element, user)
+        self.users[0].delete()
+        self.assertCounts(1, 1)
+
+    def test_counters_do_not_go_below_zero(self):
+        for user in self.users:
+            Vote.objects.vote_up(self.element, user)
+            Follow.objects.subscribe(self.element, user)
+        # Counters that were not initialized on existing data.
+        PageElement.objects.filter(pk=self.element.pk).update(
+            nb_upvotes=0, nb_followers=0)
+        Vote.objects.vote_down(self.element, self.users[0])
+        self.users[1].delete()
+        self.assertCounts(0, 0)
@@ -0,0 +1,71 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+
+from django.test import TestCase
+
+from pages.models import PageElement
+from pages.transfer import export_content_tree, import_content_tree
+
+
+class ImportContentTreeTests(TestCase):
+
+    def test_import_strips_scripts_and_event_handlers(self):
+        lines = [json.dumps({
+            'path': "/xss",
+            'slug': "xss",
+            'title': "Tom & <b onmouseover=\"alert(1)\">Jerry</b>",
+            'content_format': 'HTML',
+            'text': "<p onclick=\"alert(1)\">Hello</p>"\
+                "<script>alert(document.cookie)</script>"})]
+        roots = import_content_tree(lines)
+        element = PageElement.objects.get(pk=roots[0].pk)
+        self.assertNotIn('<script', element.text)
+        self.assertNotIn('onclick', element.text)
+        self.assertIn('<p>Hello</p>', element.text)
+        self.assertNotIn('<b', element.title)
+        self.assertNotIn('onmouseover', element.title)
+
+    def test_import_keeps_plain_titles(self):
+        lines = [json.dumps({'path': "/tools", 'slug': "tools",
+            'title': "Tools & equipment", 'content_format': 'HTML',
+            'text': "<p>Hello</p>"})]
+        roots = import_content_tree(lines)
+        element = PageElement.objects.get(pk=roots[0].pk)
+        self.assertEqual(element.title, "Tools & equipment")
+        self.assertEqual(element.text, "<p>Hello</p>")
+
+    def test_round_trip(self):
+        lines = [json.dumps({'path': "/metal", 'slug': "metal",
+                'title': "Metal", 'text': "<p>Metal</p>"}),
+            json.dumps({'path': "/metal/boxes", 'slug': "boxes",
+                'title': "Boxes", 'text': "<p>Boxes</p>"})]
+        roots = import_content_tree(lines)
+        exported = [json.loads(line)
+            for line in export_content_tree(roots)]
+        self.assertEqual([(line['path'], line['title'], line['text'])
+            for line in exported], [
+            ("/metal", "Metal", "<p>Metal</p>"),
+            ("/metal/boxes", "Boxes", "<p>Boxes</p>")])
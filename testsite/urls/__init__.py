@@ -56,6 +56,8 @@ urlpatterns += [
     # by following to insert `account` into the path.
     path('api/editables/<slug:profile>/', include('pages.urls.api.editables')),
     path('api/attendance/<slug:profile>/', include('pages.urls.api.sequences')),
+    path('api/attendance/<slug:profile>/',
+         include('pages.urls.api.attendance')),
     path('api/progress/', include('pages.urls.api.progress')),
     path('api/content/<slug:user>/newsfeed', # profile can be a user
          NewsFeedListAPIView.as_view(), name='api_news_feed'),